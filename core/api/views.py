@@ -24,6 +24,7 @@ from .serializers import (
     FilmSearchSerializer
 )
 from ..services import TMDBService, OMDbService, KinopoiskService, RatingCalculator
+from ..services.base_api import shared_client
 from ..tasks import fetch_film_data, update_film_ratings
 
 logger = logging.getLogger(__name__)
@@ -89,7 +90,7 @@ class FilmSearchView(viewsets.ReadOnlyModelViewSet):
             )
         
         try:
-            tmdb_service = TMDBService()
+            tmdb_service = shared_client(TMDBService)
             search_results = tmdb_service.search_movies(
                 query=query,
                 year=int(year) if year else None,
@@ -253,7 +254,7 @@ class FilmSearchView(viewsets.ReadOnlyModelViewSet):
         
         if local_qs.count() < 5:
             try:
-                tmdb_service = TMDBService()
+                tmdb_service = shared_client(TMDBService)
                 search_results = tmdb_service.search_movies(
                     query=query,
                     year=int(year) if year else None,
@@ -280,13 +280,19 @@ class Rating(models.Model):
             models.Index(fields=['normalized_value']),
         ]
 
-    def save(self, *args, **kwargs):
+    def update_normalized_value(self):
         """
-        При сохранении автоматически вычисляем normalized_value.
-        normalized_value = (value / max_value) * 10
+        Вычисление normalized_value = (value / max_value) * 10.
+        Вызывается из save(); при bulk_create его нужно вызвать явно.
         """
         if self.value is not None and self.max_value is not None and self.max_value > 0:
             self.normalized_value = (self.value / self.max_value) * 10
+
+    def save(self, *args, **kwargs):
+        """
+        При сохранении автоматически вычисляем normalized_value.
+        """
+        self.update_normalized_value()
         super().save(*args, **kwargs)
 
     def __str__(self):
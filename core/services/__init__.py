@@ -2,7 +2,7 @@
 Сервисные классы для Cinema Aggregator.
 """
 
-from .base_api import BaseAPIClient, APIClientError, APIRequestError, APIRateLimitError
+from .base_api import BaseAPIClient, APIClientError, APIRequestError, APIRateLimitError, APIBadRequestError
 from .tmdb_service import TMDBService
 from .omdb_service import OMDbService
 from .kinopoisk_service import KinopoiskService
@@ -13,6 +13,7 @@ __all__ = [
     'APIClientError',
     'APIRequestError',
     'APIRateLimitError',
+    'APIBadRequestError',
     'TMDBService',
     'OMDbService',
     'KinopoiskService',
@@ -1,15 +1,28 @@
 import logging
+import math
+import random
+import threading
 import time
-from functools import wraps
-from typing import Optional, Dict, Any
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import partial, wraps
+from typing import Optional, Dict, Any, Generic, Tuple, Type, TypeVar, Union
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from django.core.cache import cache
 from django.conf import settings
 
+from .cache_utils import make_cache_key, cache_get_json, cache_get_json_local, cache_set_json_background, cache_delete_local
+from .concurrency import single_flight
+
 logger = logging.getLogger(__name__)
 
 
+_ClientT = TypeVar('_ClientT', bound='BaseAPIClient')
+
+
 class APIClientError(Exception):
     """Базовое исключение для ошибок API клиента"""
     pass
@@ -22,6 +35,14 @@ class APIRequestError(APIClientError):
 
 class APIRateLimitError(APIClientError):
     """Исключение для превышения лимита запросов"""
+    
+    def __init__(self, message: str = '', retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class APIBadRequestError(APIRequestError):
+    """Исключение для ошибок клиента (4xx), повторять такие запросы бессмысленно"""
     pass
 
 
@@ -32,10 +53,15 @@ class BaseAPIClient:
     """
     
     BASE_URL: str = None
-    DEFAULT_TIMEOUT: int = 10
+    DEFAULT_TIMEOUT: Tuple[float, float] = (3.05, 10)  # (connect, read)
     DEFAULT_RETRIES: int = 3
     RETRY_DELAY: float = 1.0 
+    RETRY_MAX_DELAY: float = 10.0
     CACHE_TIMEOUT: int = 3600  
+    ETAG_CACHE_TIMEOUT: int = 3600 * 6
+    LOCAL_CACHE_TIMEOUT: int = 30  # кэш ответов в памяти процесса, не сбрасывается из других процессов
+    POOL_CONNECTIONS: int = 20
+    POOL_MAXSIZE: int = 50
     
     def __init__(self):
         if not self.BASE_URL:
@@ -45,7 +71,10 @@ class BaseAPIClient:
         self.setup_session()
         
     def setup_session(self):
-        """Настройка сессии (заголовки, авторизация и т.д.)"""
+        """Настройка сессии (заголовки, авторизация, пул соединений и т.д.)"""
+        adapter = HTTPAdapter(pool_connections=self.POOL_CONNECTIONS, pool_maxsize=self.POOL_MAXSIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'User-Agent': 'CinemaAggregator/1.0',
             'Accept': 'application/json',
@@ -55,11 +84,13 @@ class BaseAPIClient:
         """
         Генерация ключа для кэша на основе метода, параметров и эндпоинта.
         """
-        import hashlib
-        import json
-        
-        cache_str = f"{method}:{self.BASE_URL}:{endpoint}:{json.dumps(params, sort_keys=True)}"
-        return f"api_cache:{hashlib.md5(cache_str.encode()).hexdigest()}"
+        return make_cache_key('api_cache', method, self.BASE_URL, endpoint, tuple(sorted(params.items())))
+    
+    def get_validator_key(self, endpoint: str, params: Dict) -> str:
+        """
+        Ключ для хранения ETag и тела последнего ответа (условные GET-запросы).
+        """
+        return make_cache_key('api_etag', self.BASE_URL, endpoint, sorted(params.items()))
     
     def should_cache_request(self, method: str, params: Dict) -> bool:
         """
@@ -68,6 +99,13 @@ class BaseAPIClient:
         """
         return method.upper() == 'GET'
     
+    def should_cache_response(self, result: Dict) -> bool:
+        """
+        Определяет, можно ли сохранить ответ в кэш.
+        Дочерние классы отклоняют ответы, которые API возвращает с кодом 200 при ошибке.
+        """
+        return True
+    
     def handle_error(self, response: requests.Response, url: str, params: Dict):
         """
         Обработка ошибок HTTP запросов.
@@ -75,10 +113,13 @@ class BaseAPIClient:
         status_code = response.status_code
         
         if status_code == 429: 
-            raise APIRateLimitError(f"Превышен лимит запросов к API. URL: {url}")
+            raise APIRateLimitError(
+                f"Превышен лимит запросов к API. URL: {url}",
+                retry_after=self._parse_retry_after(response),
+            )
         
         elif 400 <= status_code < 500:
-            raise APIRequestError(
+            raise APIBadRequestError(
                 f"Ошибка клиента {status_code} при запросе к {url}. "
                 f"Ответ: {response.text[:200]}"
             )
@@ -88,6 +129,39 @@ class BaseAPIClient:
                 f"Ошибка сервера {status_code} при запросе к {url}"
             )
     
+    @staticmethod
+    def _parse_retry_after(response: requests.Response) -> Optional[float]:
+        """
+        Значение заголовка Retry-After в секундах.
+        Поддерживаются оба формата: число секунд и HTTP-дата.
+        """
+        value = response.headers.get('Retry-After', '').strip()
+        if not value:
+            return None
+        
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            if retry_at.tzinfo is None:
+                retry_at = retry_at.replace(tzinfo=timezone.utc)
+            seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+        
+        return max(seconds, 0.0) if math.isfinite(seconds) else None
+    
+    def get_retry_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Пауза перед повтором: Retry-After от сервера, если он передан,
+        иначе экспоненциальная задержка со случайным разбросом (full jitter),
+        чтобы параллельные запросы не повторялись одновременно.
+        """
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.RETRY_MAX_DELAY, self.RETRY_DELAY * 2 ** attempt))
+    
     def _make_request(
         self,
         method: str,
@@ -95,7 +169,7 @@ class BaseAPIClient:
         params: Optional[Dict] = None,
         data: Optional[Dict] = None,
         headers: Optional[Dict] = None,
-        timeout: Optional[int] = None,
+        timeout: Optional[Union[float, Tuple[float, float]]] = None,
         use_cache: bool = False,
         cache_timeout: Optional[int] = None,
         retries: Optional[int] = None,
@@ -116,16 +190,51 @@ class BaseAPIClient:
         cache_key = None
         if use_cache and self.should_cache_request(method, params):
             cache_key = self.get_cache_key(method, params, endpoint)
-            cached_response = cache.get(cache_key)
+            cached_response = cache_get_json_local(cache_key, self.LOCAL_CACHE_TIMEOUT)
             if cached_response:
                 return cached_response
         
+        send = partial(self._send_request, method, url, endpoint, params, data, headers,
+                       timeout, retries, cache_key, cache_timeout)
+        if cache_key is None:
+            return send()
+        
+        # Одновременные промахи по одному ключу выполняют один HTTP-запрос,
+        # каждый вызывающий получает собственную копию ответа
+        return orjson.loads(single_flight(cache_key, lambda: orjson.dumps(send())))
+    
+    def _send_request(
+        self,
+        method: str,
+        url: str,
+        endpoint: str,
+        params: Dict,
+        data: Optional[Dict],
+        headers: Dict,
+        timeout: Union[float, Tuple[float, float]],
+        retries: int,
+        cache_key: Optional[str],
+        cache_timeout: int,
+    ) -> Dict:
+        """
+        Выполнение HTTP-запроса с повторами, условными GET-запросами по ETag
+        и сохранением ответа в кэш (если передан cache_key).
+        Запись в кэш выполняется в фоне и не задерживает возврат ответа.
+        """
+        validator_key = None
+        validator = None
+        if method.upper() == 'GET':
+            validator_key = self.get_validator_key(endpoint, params)
+            validator = cache_get_json(validator_key)
+        
         last_exception = None
         
         for attempt in range(retries):
             try:
                 request_headers = self.session.headers.copy()
                 request_headers.update(headers)
+                if validator:
+                    request_headers['If-None-Match'] = validator['etag']
                 
                 response = self.session.request(
                     method=method,
@@ -136,29 +245,49 @@ class BaseAPIClient:
                     timeout=timeout,
                 )
                 
+                if response.status_code == 304 and validator:
+                    result = validator['data']
+                    if self.should_cache_response(result):
+                        cache_set_json_background(validator_key, validator, self.ETAG_CACHE_TIMEOUT)
+                        if cache_key:
+                            cache_set_json_background(cache_key, result, cache_timeout)
+                    return result
+                
                 if response.status_code >= 400:
                     self.handle_error(response, url, params)
                 
                 try:
-                    result = response.json()
-                except ValueError as e:
+                    result = orjson.loads(response.content)
+                except orjson.JSONDecodeError as e:
                     raise APIRequestError(f"Не удалось распарсить JSON ответ: {str(e)}")
                 
-                if cache_key:
-                    cache.set(cache_key, result, cache_timeout)
+                if self.should_cache_response(result):
+                    etag = response.headers.get('ETag')
+                    if validator_key and etag:
+                        cache_set_json_background(validator_key, {'etag': etag, 'data': result}, self.ETAG_CACHE_TIMEOUT)
+                    
+                    if cache_key:
+                        cache_set_json_background(cache_key, result, cache_timeout)
                 
                 return result
                 
-            except APIRateLimitError:
-                wait_time = self.RETRY_DELAY * (attempt + 1) * 2
-                time.sleep(wait_time)
-                last_exception = APIRateLimitError
+            except APIBadRequestError:
+                raise
+                
+            except APIRateLimitError as e:
+                last_exception = e
+                # Если сервер просит подождать дольше RETRY_MAX_DELAY, повторы внутри запроса
+                # бессмысленны: ошибка передается выше (повтор задачи Celery с backoff)
+                too_long = e.retry_after is not None and e.retry_after > self.RETRY_MAX_DELAY
+                if attempt < retries - 1 and not too_long:
+                    time.sleep(self.get_retry_delay(attempt, e.retry_after))
+                else:
+                    raise
                 
             except (APIRequestError, requests.exceptions.RequestException) as e:
                 last_exception = e
                 if attempt < retries - 1:
-                    wait_time = self.RETRY_DELAY * (attempt + 1)
-                    time.sleep(wait_time)
+                    time.sleep(self.get_retry_delay(attempt))
                 else:
                     raise APIRequestError(f"Запрос не удался после {retries} попыток: {str(e)}")
         
@@ -172,6 +301,7 @@ class BaseAPIClient:
     ) -> Dict:
         """
         Выполнение GET запроса.
+        Ответ кэшируется на CACHE_TIMEOUT только при use_cache=True.
         """
         return self._make_request('GET', endpoint, params=params, **kwargs)
     
@@ -186,19 +316,21 @@ class BaseAPIClient:
         """
         return self._make_request('POST', endpoint, data=data, **kwargs)
     
-    def clear_cache_for_request(self, method: str, params: Dict):
+    def clear_cache_for_request(self, method: str, params: Dict, endpoint: str = ""):
         """
         Очистка кэша для конкретного запроса.
+        Аргументы те же, что и у get_cache_key.
+        
+        Django cache очищается для всех процессов, а кэш в памяти — только
+        в текущем: другие воркеры могут отдавать старый ответ еще до LOCAL_CACHE_TIMEOUT секунд.
         """
-        cache_key = self.get_cache_key(method, params)
-        cache.delete(cache_key)
+        cache_key = self.get_cache_key(method, params, endpoint)
+        cache_delete_local(cache_key)
     
     def clear_all_cache(self):
         """
         Очистка всего кэша для этого API клиента.
         """
-        from django.core.cache import cache
-        
         keys_to_delete = []
         
         for key in cache._cache.keys():
@@ -230,4 +362,36 @@ def api_request_logger(func):
             logger.error(f"API метод упал с ошибкой {func.__name__} через {elapsed_time:.2f}s: {str(e)}")
             raise
     
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+
+_shared_clients: Dict[type, 'BaseAPIClient'] = {}
+_shared_clients_lock = threading.Lock()
+
+
+def shared_client(client_class: Type[_ClientT]) -> _ClientT:
+    """
+    Общий для процесса экземпляр клиента API, создаваемый при первом обращении.
+    Сессия и пул соединений клиента переиспользуются всеми запросами к Django.
+    """
+    client = _shared_clients.get(client_class)
+    if client is None:
+        with _shared_clients_lock:
+            client = _shared_clients.get(client_class)
+            if client is None:
+                client = _shared_clients[client_class] = client_class()
+    return client
+
+
+class SharedClient(Generic[_ClientT]):
+    """
+    Атрибут класса сервиса, возвращающий общий для процесса экземпляр клиента API:
+    
+        tmdb_service = SharedClient(TMDBService)
+    """
+    
+    def __init__(self, client_class: Type[_ClientT]):
+        self.client_class = client_class
+    
+    def __get__(self, instance: Any, owner: Optional[type] = None) -> _ClientT:
+        return shared_client(self.client_class)
\ No newline at end of file
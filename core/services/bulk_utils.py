@@ -0,0 +1,121 @@
+from typing import Dict, List, Optional, Tuple
+
+from django.utils import timezone
+
+from ..models import Film, FilmPersonRole, Person, Rating
+
+BULK_BATCH_SIZE = 1000
+RATING_SOURCE_MAPPING = {
+    'imdb': Rating.SourceChoices.IMDB,
+    'rotten_tomatoes': Rating.SourceChoices.ROTTEN_TOMATOES,
+    'metacritic': Rating.SourceChoices.METACRITIC,
+    'kinopoisk': Rating.SourceChoices.KINOPOISK
+}
+ROLE_MAPPING = {
+    'actor': FilmPersonRole.RoleChoices.ACTOR,
+    'director': FilmPersonRole.RoleChoices.DIRECTOR
+}
+
+
+def save_ratings_bulk(film_to_ratings: Dict[Film, Dict]) -> None:
+    """
+    Сохранение рейтингов нескольких фильмов в базу данных одним запросом.
+    Рейтинги передаются по ключам RATING_SOURCE_MAPPING ('imdb', 'kinopoisk', ...),
+    остальные ключи пропускаются. Существующие рейтинги (film, source) обновляются.
+    """
+    now = timezone.now()
+    rows = []
+    for film, ratings_data in film_to_ratings.items():
+        for source_key, rating_data in ratings_data.items():
+            if source_key in RATING_SOURCE_MAPPING:
+                rating = Rating(
+                    film=film,
+                    source=RATING_SOURCE_MAPPING[source_key],
+                    value=rating_data['value'],
+                    max_value=rating_data['max_value'],
+                    votes_count=rating_data.get('votes', None),
+                    last_updated=now
+                )
+                # bulk_create не вызывает Rating.save()
+                rating.update_normalized_value()
+                rows.append(rating)
+    
+    if rows:
+        Rating.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['film', 'source'],
+            update_fields=['value', 'max_value', 'normalized_value', 'votes_count', 'last_updated'],
+            batch_size=BULK_BATCH_SIZE
+        )
+
+
+def upsert_persons_bulk(film_credits: List[Tuple[Film, Dict]], max_directors: Optional[int] = None,
+                        max_cast: Optional[int] = None) -> List[int]:
+    """
+    Добавление режиссеров и актеров к фильмам по credits из TMDB.
+    Персоны и роли создаются пачками (bulk_create с ignore_conflicts),
+    уже существующие записи не изменяются.
+    
+    Returns:
+        List[int]: ID персон, созданных этим вызовом
+    """
+    person_dicts = {}
+    role_tuples = []
+    
+    for film, credits_data in film_credits:
+        crew = credits_data.get('crew', [])
+        directors = [person for person in crew if person.get('job') == 'Director'][:max_directors]
+        film_people = [(person_data, 'director', None, 0) for person_data in directors]
+        
+        cast = credits_data.get('cast', [])[:max_cast]
+        film_people.extend(
+            (actor_data, 'actor', actor_data.get('character'), actor_data.get('order', i))
+            for i, actor_data in enumerate(cast)
+        )
+        
+        for person_data, role, character_name, order in film_people:
+            person_id = person_data.get('id')
+            if not person_id:
+                continue
+            person_dicts.setdefault(person_id, (person_data, role))
+            role_tuples.append((film, person_id, role, character_name, order))
+    
+    if not person_dicts:
+        return []
+    
+    existing_ids = set(
+        Person.objects.filter(tmdb_id__in=person_dicts).values_list('tmdb_id', flat=True)
+    )
+    Person.objects.bulk_create(
+        [
+            Person(
+                tmdb_id=person_id,
+                name=person_data.get('name', ''),
+                original_name=person_data.get('original_name', ''),
+                profession=Person.ProfessionChoices.DIRECTOR if role == 'director' else Person.ProfessionChoices.ACTOR
+            )
+            for person_id, (person_data, role) in person_dicts.items()
+            if person_id not in existing_ids
+        ],
+        ignore_conflicts=True,
+        batch_size=BULK_BATCH_SIZE
+    )
+    persons = Person.objects.in_bulk(list(person_dicts), field_name='tmdb_id')
+    
+    FilmPersonRole.objects.bulk_create(
+        [
+            FilmPersonRole(
+                film=film,
+                person=persons[person_id],
+                role=ROLE_MAPPING[role],
+                character_name=character_name,
+                order=order
+            )
+            for film, person_id, role, character_name, order in role_tuples
+        ],
+        ignore_conflicts=True,
+        batch_size=BULK_BATCH_SIZE
+    )
+    
+    return [persons[person_id].id for person_id in person_dicts if person_id not in existing_ids]
\ No newline at end of file
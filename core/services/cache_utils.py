@@ -0,0 +1,249 @@
+import hashlib
+import inspect
+import operator
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial, wraps
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import orjson
+from django.core.cache import cache
+
+from .concurrency import run_in_background, single_flight
+
+_MISSING = object()
+_bypass = threading.local()
+
+LOCAL_CACHE_TIMEOUT = 300
+LOCAL_CACHE_MAXSIZE = 1024
+
+
+class LocalTTLCache:
+    """
+    Небольшой потокобезопасный LRU-кэш в памяти процесса с ограничением размера и TTL.
+    Используется как первый уровень перед Django cache.
+    Просроченные записи удаляются при обращении к ним, при переполнении
+    вытесняется запись, к которой дольше всего не обращались.
+    """
+    
+    def __init__(self, maxsize: int = LOCAL_CACHE_MAXSIZE, timeout: int = LOCAL_CACHE_TIMEOUT):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return item[1]
+    
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> None:
+        expires_at = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_local_cache = LocalTTLCache()
+_pending_writes: Dict[str, object] = {}
+_pending_writes_lock = threading.Lock()
+
+
+def make_cache_key(prefix: str, *parts) -> str:
+    """
+    Построение ключа кэша фиксированной длины.
+    Части ключа хэшируются BLAKE2b, поэтому пользовательский ввод
+    (пробелы, кириллица, длинные запросы) не попадает в ключ напрямую
+    и не упирается в ограничение Memcached на 250 байт.
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f"{prefix}:{digest}"
+
+
+def cache_get_json(key: str) -> Optional[Any]:
+    """
+    Чтение значения, сохраненного через cache_set_json.
+    """
+    raw = cache.get(key)
+    if not raw:
+        return None
+    return orjson.loads(raw)
+
+
+def cache_set_json(key: str, value: Any, timeout: Optional[int] = None) -> None:
+    """
+    Сохранение значения в кэш в виде JSON-байтов (orjson вместо pickle).
+    """
+    cache.set(key, orjson.dumps(value), timeout)
+
+
+def _write_pending(key: str, token: object, raw: bytes, timeout: Optional[int]) -> None:
+    with _pending_writes_lock:
+        if _pending_writes.get(key) is not token:
+            return
+    
+    cache.set(key, raw, timeout)
+    
+    with _pending_writes_lock:
+        if _pending_writes.get(key) is token:
+            del _pending_writes[key]
+            return
+    
+    # Ключ сброшен через cache_delete_local во время записи
+    cache.delete(key)
+
+
+def cache_set_json_background(key: str, value: Any, timeout: Optional[int] = None) -> None:
+    """
+    То же, что cache_set_json, но запись в кэш выполняется в фоне.
+    Значение сериализуется сразу, поэтому его можно изменять после вызова.
+    
+    Запись отменяется, если ключ сброшен через cache_delete_local раньше, чем она выполнилась.
+    Это работает только внутри процесса: сброс из другого процесса может
+    опередить отложенную запись, и тогда старое значение вернется в кэш до истечения TTL.
+    """
+    token = object()
+    with _pending_writes_lock:
+        _pending_writes[key] = token
+    run_in_background(partial(_write_pending, key, token, orjson.dumps(value), timeout))
+
+
+def cache_get_json_local(key: str, local_timeout: int = LOCAL_CACHE_TIMEOUT) -> Optional[Any]:
+    """
+    Чтение значения, сохраненного через cache_set_json, через кэш в памяти процесса:
+    частые ключи не требуют обращения к Django cache в течение local_timeout.
+    """
+    raw = _local_cache.get(key)
+    if raw is None:
+        raw = cache.get(key)
+        if not raw:
+            return None
+        _local_cache.set(key, raw, local_timeout)
+    return orjson.loads(raw)
+
+
+def cache_delete_local(key: str) -> None:
+    """
+    Удаление значения из Django cache и из кэша в памяти текущего процесса.
+    Отложенная запись этого ключа (cache_set_json_background) отменяется.
+    """
+    with _pending_writes_lock:
+        _pending_writes.pop(key, None)
+    _local_cache.delete(key)
+    cache.delete(key)
+
+
+def cache_get_many_json(keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    Пакетное чтение значений, сохраненных через cache_set_json / cache_set_many_json.
+    """
+    return {key: orjson.loads(raw) for key, raw in cache.get_many(list(keys)).items() if raw}
+
+
+def cache_set_many_json(data: Dict[str, Any], timeout: Optional[int] = None) -> None:
+    """
+    Пакетное сохранение значений в кэш в виде JSON-байтов.
+    """
+    cache.set_many({key: orjson.dumps(value) for key, value in data.items()}, timeout)
+
+
+@contextmanager
+def bypass_cache_reads():
+    """
+    Внутри блока методы с cached_json не читают кэш: ответ запрашивается из API
+    заново и сохраняется в кэш. Используется задачами обновления данных.
+    Действует только в текущем потоке; можно использовать и как декоратор.
+    """
+    previous = getattr(_bypass, 'active', False)
+    _bypass.active = True
+    try:
+        yield
+    finally:
+        _bypass.active = previous
+
+
+def cached_json(timeout: int = 3600, miss_timeout: int = 60, local_timeout: int = LOCAL_CACHE_TIMEOUT,
+                is_miss: Callable[[Any], bool] = operator.not_):
+    """
+    Декоратор для кэширования ответов методов сервисов по (метод, аргументы).
+    Двухуровневый кэш: сначала память процесса (local_timeout), затем Django cache.
+    Пустые ответы (по умолчанию — ложные значения, иначе по is_miss) кэшируются
+    на miss_timeout, чтобы повторные запросы с тем же ID не уходили во внешний API сразу же.
+    
+    Одновременные промахи по одному ключу объединяются через single_flight.
+    В памяти процесса хранятся JSON-байты, поэтому вызывающий код
+    всегда получает собственную копию и может ее изменять.
+    
+    Кэш конкретного вызова сбрасывается через method.invalidate(*args, **kwargs)
+    с аргументами вызова (без self); method.cache_key(*args, **kwargs)
+    возвращает ключ Django cache для пакетного чтения через get_many.
+    Ключ строится по сигнатуре метода с подставленными значениями по умолчанию,
+    поэтому способ передачи аргументов на него не влияет.
+    invalidate очищает память только текущего процесса, поэтому для методов,
+    кэш которых сбрасывается явно, нужно передавать local_timeout=0 (без кэша в памяти).
+    Внутри bypass_cache_reads() кэш не читается, а только обновляется.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        
+        def cache_key(self, args: tuple, kwargs: Dict) -> str:
+            # Позиционная и именованная передача одного аргумента, а также
+            # явно переданное значение по умолчанию дают один и тот же ключ
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            parts = []
+            for name, value in list(bound.arguments.items())[1:]:
+                if signature.parameters[name].kind is inspect.Parameter.VAR_KEYWORD:
+                    value = sorted(value.items())
+                parts.append((name, value))
+            return make_cache_key('svc', func.__qualname__, tuple(parts))
+        
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            key = cache_key(self, args, kwargs)
+            bypass = getattr(_bypass, 'active', False)
+            raw = _local_cache.get(key) if local_timeout and not bypass else None
+            if raw is not None:
+                return orjson.loads(raw)
+            
+            def load() -> bytes:
+                result = _MISSING if bypass else cache.get(key, _MISSING)
+                if result is _MISSING:
+                    result = func(self, *args, **kwargs)
+                    cache.set(key, result, miss_timeout if is_miss(result) else timeout)
+                
+                raw = orjson.dumps(result)
+                if local_timeout:
+                    _local_cache.set(key, raw, min(local_timeout, miss_timeout) if is_miss(result) else local_timeout)
+                return raw
+            
+            if bypass:
+                return orjson.loads(load())
+            return orjson.loads(single_flight(key, load))
+        
+        def invalidate(*args, **kwargs) -> None:
+            cache_delete_local(cache_key(None, args, kwargs))
+        
+        wrapper.invalidate = invalidate
+        wrapper.cache_key = lambda *args, **kwargs: cache_key(None, args, kwargs)
+        return wrapper
+    
+    return decorator
\ No newline at end of file
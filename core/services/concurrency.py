@@ -0,0 +1,101 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 16
+BACKGROUND_WORKERS = 4
+SINGLE_FLIGHT_TIMEOUT = 10
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='cinema-api')
+_background_executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix='cinema-bg')
+_local = threading.local()
+_inflight: Dict[str, Tuple[threading.Event, List]] = {}
+_inflight_lock = threading.Lock()
+
+
+def _run_in_pool(call: Callable[[], Any]) -> Any:
+    _local.in_pool = True
+    try:
+        return call()
+    finally:
+        _local.in_pool = False
+
+
+def gather(*calls: Callable[[], Any], return_exceptions: bool = False) -> List[Any]:
+    """
+    Параллельное выполнение независимых вызовов к внешним API в общем пуле потоков.
+    Результаты возвращаются в порядке вызовов. При return_exceptions=True
+    исключение отдельного вызова возвращается вместо его результата.
+    
+    Вызовы изнутри пула выполняются последовательно в текущем потоке,
+    чтобы вложенные обращения не исчерпали пул и не заблокировали друг друга.
+    """
+    if len(calls) < 2 or getattr(_local, 'in_pool', False):
+        futures = None
+    else:
+        futures = [_executor.submit(_run_in_pool, call) for call in calls]
+    
+    results = []
+    for i, call in enumerate(calls):
+        try:
+            results.append(futures[i].result() if futures else call())
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    
+    return results
+
+
+def _run_logged(call: Callable[[], Any]) -> None:
+    try:
+        call()
+    except Exception as e:
+        logger.warning(f"Ошибка фоновой задачи: {str(e)}")
+
+
+def run_in_background(call: Callable[[], Any]) -> None:
+    """
+    Запуск некритичной операции (например, записи в кэш) в отдельном пуле потоков
+    без ожидания результата. Ошибки только логируются.
+    """
+    _background_executor.submit(_run_logged, call)
+
+
+def single_flight(key: str, call: Callable[[], Any], timeout: float = SINGLE_FLIGHT_TIMEOUT) -> Any:
+    """
+    Объединение одновременных одинаковых запросов внутри процесса.
+    Первый поток с данным ключом выполняет вызов, остальные ждут его результата
+    (не дольше timeout, после чего выполняют вызов сами).
+    Результат передается всем ожидающим как есть, поэтому он не должен изменяться.
+    """
+    with _inflight_lock:
+        entry = _inflight.get(key)
+        is_leader = entry is None
+        if is_leader:
+            entry = _inflight[key] = (threading.Event(), [])
+    
+    event, outcome = entry
+    
+    if not is_leader:
+        if event.wait(timeout) and outcome:
+            result, error = outcome[0]
+            if error is not None:
+                raise error
+            return result
+        return call()
+    
+    try:
+        result = call()
+        outcome.append((result, None))
+        return result
+    except Exception as e:
+        outcome.append((None, e))
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        event.set()
\ No newline at end of file
@@ -1,11 +1,15 @@
 import logging
 import re
+from functools import partial
 from typing import Dict, List, Optional
 from django.core.cache import cache
 
-from .tmdb_service import TMDBService
+from .tmdb_service import TMDBService, TMDB_IMAGE_W185, TMDB_IMAGE_W500, TMDB_IMAGE_ORIGINAL, parse_release_year
 from .omdb_service import OMDbService
 from .kinopoisk_service import KinopoiskService
+from .base_api import SharedClient
+from .cache_utils import make_cache_key, cache_get_json, cache_set_json, cache_get_many_json, cache_set_many_json
+from .concurrency import gather
 
 logger = logging.getLogger(__name__)
 
@@ -15,10 +19,11 @@ class FilmAggregator:
     Сервис для агрегации всех данных о фильме из разных источников в реальном времени.
     """
     
-    def __init__(self):
-        self.tmdb_service = TMDBService()
-        self.omdb_service = OMDbService()
-        self.kinopoisk_service = KinopoiskService()
+    CACHE_TIMEOUT = 3600
+    
+    tmdb_service = SharedClient(TMDBService)
+    omdb_service = SharedClient(OMDbService)
+    kinopoisk_service = SharedClient(KinopoiskService)
     
     def _clean_cache_key(self, key: str) -> str:
         """Очистка ключа кэша от недопустимых символов."""
@@ -29,91 +34,15 @@ class FilmAggregator:
         Получение всех данных о фильме в реальном времени.
         """
         try:
-            cache_key = f'film_full_data_{tmdb_id}'
-            cached_data = cache.get(cache_key)
+            cache_key = make_cache_key('film_full_data', tmdb_id)
+            cached_data = cache_get_json(cache_key)
             if cached_data:
                 return cached_data
             
-            tmdb_data = self._get_tmdb_movie_data(tmdb_id)
-            
-            if not tmdb_data:
-                return None
-            
-            if not tmdb_data.get('title'):
-                return None
-            
-            title = tmdb_data.get('title', '')
-            original_title = tmdb_data.get('original_title', '')
-
-            if title == original_title and original_title:
-                search_title = original_title
-            else:
-                search_title = title if title else original_title
-
-            kinopoisk_search_title = search_title
-
-            release_date = tmdb_data.get('release_date', '')
-            year = int(release_date[:4]) if release_date and len(release_date) >= 4 else None
-            
-            poster_path = tmdb_data.get('poster_path', '')
-            poster_url = f"https://image.tmdb.org/t/p/original{poster_path}" if poster_path else None
-            
-            film_data = {
-                'tmdb_id': tmdb_data.get('id'),
-                'title': tmdb_data.get('title', ''),
-                'original_title': tmdb_data.get('original_title', ''),
-                'year': year,
-                'description': tmdb_data.get('overview', ''),
-                'poster_url': poster_url,
-                'imdb_id': tmdb_data.get('imdb_id', ''),
-                'runtime': tmdb_data.get('runtime'),
-                'genres': [genre['name'] for genre in tmdb_data.get('genres', [])],
-                'countries': [country['name'] for country in tmdb_data.get('production_countries', [])],
-                'tmdb_rating': tmdb_data.get('vote_average'),
-                'tmdb_votes': tmdb_data.get('vote_count'),
-            }
+            film_data = self._build_film_data(tmdb_id)
             
-            ratings = self._get_all_ratings(film_data['imdb_id'], film_data['title'], film_data['year'])
-            film_data['ratings'] = ratings
-            
-            normalized_ratings = []
-            for source, rating in ratings.items():
-                if 'value' in rating and 'max_value' in rating and rating['max_value'] > 0:
-                    normalized_value = (rating['value'] / rating['max_value']) * 10
-                    ratings[source]['normalized_value'] = normalized_value
-                    normalized_ratings.append(normalized_value)
-            
-            if normalized_ratings:
-                avg_rating = sum(normalized_ratings) / len(normalized_ratings)
-                film_data['average_rating'] = round(avg_rating, 2)
-                film_data['ratings_count'] = len(ratings)
-            else:
-                film_data['average_rating'] = None
-                film_data['ratings_count'] = 0
-            
-            credits = tmdb_data.get('credits', {})
-            
-            directors = []
-            for person in credits.get('crew', []):
-                if person.get('job') == 'Director':
-                    profile_path = person.get('profile_path', '')
-                    directors.append({
-                        'name': person.get('name', ''),
-                        'photo_url': f"https://image.tmdb.org/t/p/w185{profile_path}" if profile_path else None,
-                    })
-            film_data['directors'] = directors[:3]
-            
-            actors = []
-            for person in credits.get('cast', [])[:10]:
-                profile_path = person.get('profile_path', '')
-                actors.append({
-                    'name': person.get('name', ''),
-                    'character': person.get('character', ''),
-                    'photo_url': f"https://image.tmdb.org/t/p/w185{profile_path}" if profile_path else None,
-                })
-            film_data['actors'] = actors
-            
-            cache.set(cache_key, film_data, 3600)
+            if film_data:
+                cache_set_json(cache_key, film_data, self.CACHE_TIMEOUT)
             
             return film_data
             
@@ -121,30 +50,163 @@ class FilmAggregator:
             logger.error(f"Ошибка получения данных для TMDB ID {tmdb_id}: {str(e)}")
             return None
     
+    def get_films_data(self, tmdb_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Пакетное получение данных о нескольких фильмах.
+        Кэш читается одним get_many, недостающие фильмы собираются параллельно
+        и записываются в кэш одним set_many.
+        """
+        cache_keys = {tmdb_id: make_cache_key('film_full_data', tmdb_id) for tmdb_id in tmdb_ids}
+        cached_data = cache_get_many_json(cache_keys.values())
+        
+        films = {}
+        missing_ids = []
+        for tmdb_id, cache_key in cache_keys.items():
+            if cached_data.get(cache_key):
+                films[tmdb_id] = cached_data[cache_key]
+            else:
+                missing_ids.append(tmdb_id)
+        
+        results = gather(
+            *[partial(self._build_film_data, tmdb_id) for tmdb_id in missing_ids],
+            return_exceptions=True,
+        )
+        
+        to_cache = {}
+        for tmdb_id, film_data in zip(missing_ids, results):
+            if isinstance(film_data, Exception):
+                logger.error(f"Ошибка получения данных для TMDB ID {tmdb_id}: {str(film_data)}")
+                continue
+            if film_data:
+                films[tmdb_id] = film_data
+                to_cache[cache_keys[tmdb_id]] = film_data
+        
+        if to_cache:
+            cache_set_many_json(to_cache, self.CACHE_TIMEOUT)
+        
+        return films
+    
+    def _build_film_data(self, tmdb_id: int) -> Optional[Dict]:
+        """
+        Сбор данных о фильме из внешних API (без обращения к кэшу).
+        """
+        tmdb_data = self._get_tmdb_movie_data(tmdb_id)
+        
+        if not tmdb_data:
+            return None
+        
+        if not tmdb_data.get('title'):
+            return None
+        
+        title = tmdb_data.get('title', '')
+        original_title = tmdb_data.get('original_title', '')
+        
+        if title == original_title and original_title:
+            search_title = original_title
+        else:
+            search_title = title if title else original_title
+        
+        kinopoisk_search_title = search_title
+        
+        year = parse_release_year(tmdb_data.get('release_date'))
+        
+        poster_path = tmdb_data.get('poster_path', '')
+        poster_url = TMDB_IMAGE_ORIGINAL + poster_path if poster_path else None
+        
+        film_data = {
+            'tmdb_id': tmdb_data.get('id'),
+            'title': tmdb_data.get('title', ''),
+            'original_title': tmdb_data.get('original_title', ''),
+            'year': year,
+            'description': tmdb_data.get('overview', ''),
+            'poster_url': poster_url,
+            'imdb_id': tmdb_data.get('imdb_id', ''),
+            'runtime': tmdb_data.get('runtime'),
+            'genres': [genre['name'] for genre in tmdb_data.get('genres', [])],
+            'countries': [country['name'] for country in tmdb_data.get('production_countries', [])],
+            'tmdb_rating': tmdb_data.get('vote_average'),
+            'tmdb_votes': tmdb_data.get('vote_count'),
+        }
+        
+        ratings = self._get_all_ratings(film_data['imdb_id'], film_data['title'], film_data['year'])
+        film_data['ratings'] = ratings
+        
+        normalized_ratings = []
+        for source, rating in ratings.items():
+            if 'value' in rating and 'max_value' in rating and rating['max_value'] > 0:
+                normalized_value = (rating['value'] / rating['max_value']) * 10
+                ratings[source]['normalized_value'] = normalized_value
+                normalized_ratings.append(normalized_value)
+        
+        if normalized_ratings:
+            avg_rating = sum(normalized_ratings) / len(normalized_ratings)
+            film_data['average_rating'] = round(avg_rating, 2)
+            film_data['ratings_count'] = len(ratings)
+        else:
+            film_data['average_rating'] = None
+            film_data['ratings_count'] = 0
+        
+        credits = tmdb_data.get('credits', {})
+        
+        directors = []
+        for person in credits.get('crew', []):
+            if person.get('job') == 'Director':
+                profile_path = person.get('profile_path', '')
+                directors.append({
+                    'name': person.get('name', ''),
+                    'photo_url': TMDB_IMAGE_W185 + profile_path if profile_path else None,
+                })
+                if len(directors) == 3:
+                    break
+        film_data['directors'] = directors
+        
+        actors = []
+        for person in credits.get('cast', [])[:10]:
+            profile_path = person.get('profile_path', '')
+            actors.append({
+                'name': person.get('name', ''),
+                'character': person.get('character', ''),
+                'photo_url': TMDB_IMAGE_W185 + profile_path if profile_path else None,
+            })
+        film_data['actors'] = actors
+        
+        return film_data
+    
     def _get_tmdb_movie_data(self, tmdb_id: int) -> Optional[Dict]:
         """
         Получение данных о фильме из TMDB с несколькими попытками и fallback.
         """
         languages = ['ru-RU', 'en-US']
+        last_response = None
         
         for language in languages:
             tmdb_data = self.tmdb_service.get_movie_details(
                 tmdb_id,
                 append_to_response='credits',
-                language=language
+                language=language,
+                validate_id=False
             )
             
             if tmdb_data and tmdb_data.get('id') == tmdb_id:
                 return tmdb_data
+            
+            if tmdb_data:
+                last_response = tmdb_data
+        
+        search_cache_key = make_cache_key('tmdb_movie_title', tmdb_id)
+        movie_title = last_response.get('title') if last_response else None
         
-        search_cache_key = f'tmdb_movie_title_{tmdb_id}'
-        movie_title = cache.get(search_cache_key)
+        if movie_title:
+            cache.set(search_cache_key, movie_title, 3600)
+        else:
+            movie_title = cache.get(search_cache_key)
         
         if not movie_title:
             for language in languages:
                 temp_data = self.tmdb_service.get_movie_details(
                     tmdb_id,
-                    language=language
+                    language=language,
+                    validate_id=False
                 )
                 if temp_data and temp_data.get('title'):
                     movie_title = temp_data.get('title')
@@ -181,24 +243,26 @@ class FilmAggregator:
     def _get_all_ratings(self, imdb_id: str, title: str, year: int) -> Dict:
         """
         Получение рейтингов из всех источников.
+        OMDb и Кинопоиск по IMDb ID запрашиваются параллельно.
         """
         ratings = {}
         
         if imdb_id:
-            try:
-                omdb_ratings = self.omdb_service.get_movie_ratings(imdb_id)
+            omdb_ratings, kp_ratings = gather(
+                partial(self.omdb_service.get_movie_ratings, imdb_id),
+                partial(self._get_kinopoisk_ratings_by_imdb_id, imdb_id),
+                return_exceptions=True,
+            )
+            
+            if isinstance(omdb_ratings, Exception):
+                logger.error(f"Ошибка получения рейтингов OMDb для {imdb_id}: {str(omdb_ratings)}")
+            else:
                 ratings.update(omdb_ratings)
-            except Exception as e:
-                logger.error(f"Ошибка получения рейтингов OMDb для {imdb_id}: {str(e)}")
-        
-        if imdb_id:
-            try:
-                kinopoisk_movie = self.kinopoisk_service.get_movie_by_imdb_id(imdb_id)
-                if kinopoisk_movie:
-                    kp_ratings = self.kinopoisk_service.get_movie_rating(kinopoisk_movie)
-                    ratings.update(kp_ratings)
-            except Exception as e:
-                logger.error(f"Ошибка получения рейтингов Кинопоиска по IMDb ID {imdb_id}: {str(e)}")
+            
+            if isinstance(kp_ratings, Exception):
+                logger.error(f"Ошибка получения рейтингов Кинопоиска по IMDb ID {imdb_id}: {str(kp_ratings)}")
+            else:
+                ratings.update(kp_ratings)
         
         if 'kinopoisk' not in ratings and title:
             try:
@@ -213,12 +277,21 @@ class FilmAggregator:
         
         return ratings
     
+    def _get_kinopoisk_ratings_by_imdb_id(self, imdb_id: str) -> Dict:
+        """
+        Рейтинги Кинопоиска для фильма, найденного по IMDb ID.
+        """
+        kinopoisk_movie = self.kinopoisk_service.get_movie_by_imdb_id(imdb_id)
+        if not kinopoisk_movie:
+            return {}
+        return self.kinopoisk_service.get_movie_rating(kinopoisk_movie)
+    
     def search_films(self, query: str, year: Optional[int] = None) -> List[Dict]:
         """
         Поиск фильмов в TMDB.
         """
         try:
-            cache_key = f'film_search_{query}_{year}'
+            cache_key = make_cache_key('film_search', query, year)
             cached_results = cache.get(cache_key)
             if cached_results:
                 return cached_results
@@ -230,27 +303,24 @@ class FilmAggregator:
             )
             
             films = []
-            for result in search_results.get('results', [])[:20]:
-                if not result.get('id'):
+            for result in search_results.get('results', ())[:20]:
+                get = result.get
+                result_id = get('id')
+                if not result_id:
                     continue
                     
-                release_date = result.get('release_date', '')
-                film_year = int(release_date[:4]) if release_date and len(release_date) >= 4 else None
+                poster_path = get('poster_path')
                 
-                poster_path = result.get('poster_path', '')
-                poster_url = f"https://image.tmdb.org/t/p/w500{poster_path}" if poster_path else None
-                
-                film_data = {
-                    'tmdb_id': result.get('id'),
-                    'title': result.get('title', ''),
-                    'original_title': result.get('original_title', ''),
-                    'year': film_year,
-                    'description': result.get('overview', ''),
-                    'poster_url': poster_url,
-                    'tmdb_rating': result.get('vote_average'),
-                    'tmdb_votes': result.get('vote_count'),
-                }
-                films.append(film_data)
+                films.append({
+                    'tmdb_id': result_id,
+                    'title': get('title', ''),
+                    'original_title': get('original_title', ''),
+                    'year': parse_release_year(get('release_date')),
+                    'description': get('overview', ''),
+                    'poster_url': TMDB_IMAGE_W500 + poster_path if poster_path else None,
+                    'tmdb_rating': get('vote_average'),
+                    'tmdb_votes': get('vote_count'),
+                })
             
             cache.set(cache_key, films, 300)
             return films
@@ -1,9 +1,16 @@
 import logging
 from typing import Dict, Optional
-from django.core.cache import cache
+from django.core.cache import cache, caches, DEFAULT_CACHE_ALIAS
+from django.core.cache.backends.redis import RedisCache
+
+from .cache_utils import make_cache_key, cache_get_json, cache_set_json
 
 logger = logging.getLogger(__name__)
 
+FILM_DATA_VERSION_KEY = 'film_data_version'
+FILM_CACHE_PREFIXES = ('film_data:', 'svc:', 'kp:', 'api_cache:', 'api_etag:')
+DELETE_BATCH_SIZE = 500
+
 
 class FilmCacheService:
     """
@@ -11,13 +18,33 @@ class FilmCacheService:
     Предотвращает проблемы с некорректным кэшированием.
     """
     
+    @staticmethod
+    def _get_redis_client():
+        """
+        Клиент Redis, если кэш работает на RedisCache, иначе None.
+        """
+        backend = caches[DEFAULT_CACHE_ALIAS]
+        if isinstance(backend, RedisCache):
+            return backend._cache.get_client(write=True)
+        return None
+    
+    @staticmethod
+    def _film_data_key(kinopoisk_id: int) -> str:
+        """
+        Ключ данных фильма с учетом текущей версии кэша фильмов.
+        Смена версии в clear_all_film_cache делает все старые ключи недоступными,
+        после чего они истекают по своему TTL.
+        """
+        version = cache.get(FILM_DATA_VERSION_KEY, 1)
+        return make_cache_key('film_data', version, kinopoisk_id)
+    
     @staticmethod
     def get_film_data(kinopoisk_id: int) -> Optional[Dict]:
         """
         Получение данных фильма из кэша с проверкой корректности.
         """
-        cache_key = f'film_data_{kinopoisk_id}'
-        data = cache.get(cache_key)
+        cache_key = FilmCacheService._film_data_key(kinopoisk_id)
+        data = cache_get_json(cache_key)
         
         if data:
             if data.get('kinopoisk_id') == kinopoisk_id:
@@ -35,29 +62,44 @@ class FilmCacheService:
         if data.get('kinopoisk_id') != kinopoisk_id:
             return
         
-        cache_key = f'film_data_{kinopoisk_id}'
-        cache.set(cache_key, data, timeout)
+        cache_key = FilmCacheService._film_data_key(kinopoisk_id)
+        cache_set_json(cache_key, data, timeout)
     
     @staticmethod
     def clear_film_cache(kinopoisk_id: int) -> None:
         """
         Очистка кэша для конкретного фильма.
         """
-        cache_key = f'film_data_{kinopoisk_id}'
+        cache_key = FilmCacheService._film_data_key(kinopoisk_id)
         cache.delete(cache_key)
     
     @staticmethod
     def clear_all_film_cache() -> None:
         """
         Очистка всего кэша фильмов.
+        
+        На Redis ключи находятся через SCAN по префиксам и удаляются пачками.
+        На остальных бэкендах перебрать ключи нельзя, поэтому сбрасываются только
+        данные фильмов (увеличением версии FILM_DATA_VERSION_KEY), а ответы API
+        (svc:, kp:, api_cache:, api_etag:) истекают по своему TTL.
         """
-        from django.core.cache import cache
-        keys_to_delete = []
+        client = FilmCacheService._get_redis_client()
         
-        for key in cache._cache.keys():
-            if isinstance(key, str) and (key.startswith('film_data_') or 
-                                         key.startswith('tmdb:') or 
-                                         key.startswith('api_cache:')):
-                keys_to_delete.append(key)
+        if client is not None:
+            for prefix in FILM_CACHE_PREFIXES:
+                batch = []
+                for key in client.scan_iter(match=cache.make_key(f'{prefix}*'), count=DELETE_BATCH_SIZE):
+                    batch.append(key)
+                    if len(batch) >= DELETE_BATCH_SIZE:
+                        client.delete(*batch)
+                        batch = []
+                if batch:
+                    client.delete(*batch)
+            return
         
-        cache.delete_many(keys_to_delete)
\ No newline at end of file
+        cache.add(FILM_DATA_VERSION_KEY, 1, None)
+        try:
+            cache.incr(FILM_DATA_VERSION_KEY)
+        except ValueError:
+            # Бэкенд не хранит значения (DummyCache), сбрасывать нечего
+            pass
\ No newline at end of file
@@ -1,12 +1,22 @@
 import logging
+import re
 from typing import Optional, Dict
 
 from django.conf import settings
 from django.core.cache import cache  
 from .base_api import BaseAPIClient, api_request_logger
+from .cache_utils import make_cache_key, cached_json
 
 logger = logging.getLogger(__name__)
 
+KINOPOISK_CACHE_TIMEOUT = 3600 * 6
+
+# (ключ источника, поле рейтинга, поле числа голосов) в ответе films/{id}
+_KP_RATING_FIELDS = (
+    ("kinopoisk", "ratingKinopoisk", "ratingKinopoiskVoteCount"),
+    ("imdb", "ratingImdb", "ratingImdbVoteCount"),
+)
+
 
 class KinopoiskService(BaseAPIClient):
     """
@@ -14,7 +24,7 @@ class KinopoiskService(BaseAPIClient):
     """
     
     BASE_URL = "https://kinopoiskapiunofficial.tech/api/v2.2"
-    CACHE_TIMEOUT = 3600 * 6 
+    CACHE_TIMEOUT = KINOPOISK_CACHE_TIMEOUT
     
     def setup_session(self):
         """Настройка сессии для Kinopoisk API"""
@@ -24,17 +34,14 @@ class KinopoiskService(BaseAPIClient):
             "Content-Type": "application/json"
         })
     
-    def get_cache_key(self, method: str, params: Dict) -> str:
+    def get_cache_key(self, method: str, params: Dict, endpoint: str = "") -> str:
         """
         Переопределяем метод генерации ключа кэша для Kinopoisk.
-        Убираем пробелы и специальные символы.
+        Параметры приводятся к отсортированному кортежу и хэшируются BLAKE2b без JSON.
         """
-        import hashlib
-        import json
-        
-        cache_str = f"kinopoisk:{method}:{json.dumps(params, sort_keys=True)}"
-        return f"kp:{hashlib.md5(cache_str.encode()).hexdigest()}"
+        return make_cache_key('kp', method, endpoint, tuple(sorted(params.items())))
     
+    @cached_json(local_timeout=0)
     @api_request_logger
     def get_movie_details(self, kinopoisk_id: int) -> Dict:
         """
@@ -62,6 +69,7 @@ class KinopoiskService(BaseAPIClient):
             logger.error(f"Ошибка получения данных от Кинопоиска для ID {kinopoisk_id}: {str(e)}")
             return {}
     
+    @cached_json()
     @api_request_logger
     def search_movies(self, query: str, year: Optional[int] = None, page: int = 1) -> Dict:
         """
@@ -76,7 +84,7 @@ class KinopoiskService(BaseAPIClient):
             params["yearFrom"] = year
             params["yearTo"] = year
             
-        return self.get("films", params=params)
+        return self.get("films", params=params, use_cache=False)
     
     @api_request_logger
     def get_movie_rating(self, film_data: Dict) -> Dict:
@@ -100,26 +108,25 @@ class KinopoiskService(BaseAPIClient):
                 logger.warning(f"kinopoisk_id на найдено в film_data: {film_data}")
                 return {}
             
-            data = self.get_movie_details(kinopoisk_id)
+            # Полный ответ films/{id} уже содержит рейтинги и число голосов
+            if isinstance(film_data, dict) and 'ratingKinopoiskVoteCount' in film_data:
+                data = film_data
+            else:
+                data = self.get_movie_details(kinopoisk_id)
             
             if not data:
                 return {}
             
             ratings = {}
             
-            if "ratingKinopoisk" in data and data["ratingKinopoisk"]:
-                ratings["kinopoisk"] = {
-                    "value": float(data["ratingKinopoisk"]),
-                    "max_value": 10,
-                    "votes": data.get("ratingKinopoiskVoteCount", 0)
-                }
-            
-            if "ratingImdb" in data and data["ratingImdb"]:
-                ratings["imdb"] = {
-                    "value": float(data["ratingImdb"]),
-                    "max_value": 10,
-                    "votes": data.get("ratingImdbVoteCount", 0)
-                }
+            for source, value_field, votes_field in _KP_RATING_FIELDS:
+                value = data.get(value_field)
+                if value:
+                    ratings[source] = {
+                        "value": float(value),
+                        "max_value": 10,
+                        "votes": data.get(votes_field, 0)
+                    }
             
             return ratings
             
@@ -152,12 +159,29 @@ class KinopoiskService(BaseAPIClient):
         except Exception as e:
             logger.error(f"Ошибка поиска фильма по IMDb ID {imdb_id}: {str(e)}")
             return None
+    
+    @cached_json(timeout=KINOPOISK_CACHE_TIMEOUT)
+    def resolve(self, imdb_id: Optional[str], title: Optional[str] = None, year: Optional[int] = None) -> Optional[Dict]:
+        """
+        Поиск фильма в Кинопоиске: по IMDb ID, затем по очищенному и исходному названию.
+        Возвращается первый найденный фильм, результат кэшируется.
+        """
+        if imdb_id:
+            film = self.get_movie_by_imdb_id(imdb_id, film_title=title, year=year)
+            if film:
+                return film
+        
+        if title:
+            search_results = self.search_movies(title, year=year, page=1)
+            if search_results.get("items"):
+                return search_results["items"][0]
+        
+        return None
 
     def _clean_title_for_search(self, title: str) -> str:
         """
         Очистка названия фильма для поиска.
         """
-        import re
         title = re.sub(r'\s*\(\d{4}\)', '', title)
         title = re.sub(r'\s*\([^)]*\)', '', title)
         title = re.sub(r'[^\w\s]', ' ', title, flags=re.UNICODE)
@@ -1,14 +1,36 @@
 import logging
-import re
-from typing import Dict, List, Optional
+from functools import partial
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
 from django.core.cache import cache
 
-from .tmdb_service import TMDBService
+from .tmdb_service import TMDBService, TMDB_IMAGE_W185, parse_release_year
 from .omdb_service import OMDbService
 from .kinopoisk_service import KinopoiskService
+from .base_api import SharedClient
+from .cache_utils import make_cache_key, cache_get_json, cache_set_json
+from .film_cache_service import FilmCacheService
+from .concurrency import gather, single_flight
 
 logger = logging.getLogger(__name__)
 
+_get_genre = itemgetter('genre')
+_get_country = itemgetter('country')
+
+_TITLE_KEYS = ('nameRu', 'nameOriginal', 'nameEn')
+_ORIGINAL_TITLE_KEYS = ('nameOriginal', 'nameEn', 'nameRu')
+
+
+def _first_value(data: Dict, keys: Tuple[str, ...]) -> str:
+    """
+    Первое непустое значение из data по списку ключей (или пустая строка).
+    """
+    for key in keys:
+        value = data.get(key)
+        if value:
+            return value
+    return ''
+
 
 class MovieService:
     """
@@ -17,25 +39,37 @@ class MovieService:
     TMDB для информации об актерах и режиссерах.
     """
     
-    def __init__(self):
-        self.tmdb_service = TMDBService()
-        self.omdb_service = OMDbService()
-        self.kinopoisk_service = KinopoiskService()
+    TMDB_ID_CACHE_TIMEOUT = 86400
+    TMDB_ID_MISS_CACHE_TIMEOUT = 3600
+    FILM_DATA_CACHE_TIMEOUT = 3600
+    FILM_DATA_MISS_CACHE_TIMEOUT = 60
+    FILM_DATA_SINGLE_FLIGHT_TIMEOUT = 30
     
-    def _clean_cache_key(self, key: str) -> str:
+    tmdb_service = SharedClient(TMDBService)
+    omdb_service = SharedClient(OMDbService)
+    kinopoisk_service = SharedClient(KinopoiskService)
+    
+    def _search_cache_key(self, query: str, year: Optional[int]) -> str:
         """
-        Очистка ключа кэша от недопустимых символов.
+        Ключ кэша для поиска: запрос приводится к нижнему регистру
+        с нормализованными пробелами, поэтому «Матрица» и « матрица »
+        попадают в одну запись.
         """
-        return re.sub(r'[^a-zA-Z0-9]', '_', key)
+        normalized_query = ' '.join(query.casefold().split())
+        return make_cache_key('movie_search', normalized_query, year)
     
     def search_movies(self, query: str, year: Optional[int] = None) -> List[Dict]:
         """
         Поиск фильмов через Kinopoisk API.
         """
+        query = (query or '').strip()
+        if not query:
+            return []
+        
         try:
-            safe_query = self._clean_cache_key(query)
-            cache_key = f'movie_search_{safe_query}_{year}'
-            cached_results = cache.get(cache_key)
+            year = int(year) if year else None
+            cache_key = self._search_cache_key(query, year)
+            cached_results = cache_get_json(cache_key)
             if cached_results:
                 return cached_results
             
@@ -45,36 +79,65 @@ class MovieService:
                 page=1
             )
             
-            films = []
-            for item in search_results.get('items', [])[:20]:
-                if not item.get('kinopoiskId'):
-                    continue
-                
-                film = {
-                    'kinopoisk_id': item['kinopoiskId'],
-                    'title': item.get('nameRu') or item.get('nameOriginal') or item.get('nameEn', ''),
-                    'original_title': item.get('nameOriginal') or item.get('nameEn') or item.get('nameRu', ''),
-                    'year': item.get('year'),
-                    'poster_url': item.get('posterUrl'),
-                    'imdb_id': item.get('imdbId', ''),
-                    'genres': [genre['genre'] for genre in item.get('genres', [])],
-                    'countries': [country['country'] for country in item.get('countries', [])],
-                    'rating_kinopoisk': item.get('ratingKinopoisk'),
-                    'rating_imdb': item.get('ratingImdb'),
-                    'type': item.get('type', 'FILM'),
-                }
-                films.append(film)
-            
-            cache.set(cache_key, films, 300)
+            films = [
+                self._build_search_item(item)
+                for item in search_results.get('items', [])[:20]
+                if item.get('kinopoiskId')
+            ]
+            
+            cache_set_json(cache_key, films, 300)
             return films
             
         except Exception as e:
             logger.error(f"Ошибка поиска фильмов через Кинопоиск: {str(e)}")
             return []
     
+    def _build_search_item(self, item: Dict) -> Dict:
+        """
+        Преобразование элемента поиска Кинопоиска в карточку фильма.
+        Все поля берутся из ответа поиска, дополнительных запросов не выполняется.
+        """
+        return {
+            'kinopoisk_id': item['kinopoiskId'],
+            'title': _first_value(item, _TITLE_KEYS),
+            'original_title': _first_value(item, _ORIGINAL_TITLE_KEYS),
+            'year': item.get('year'),
+            'poster_url': item.get('posterUrl'),
+            'imdb_id': item.get('imdbId', ''),
+            'genres': list(map(_get_genre, item.get('genres') or ())),
+            'countries': list(map(_get_country, item.get('countries') or ())),
+            'rating_kinopoisk': item.get('ratingKinopoisk'),
+            'rating_imdb': item.get('ratingImdb'),
+            'type': item.get('type', 'FILM'),
+        }
+    
     def _find_tmdb_id_for_film(self, title: str, original_title: str, year: int, imdb_id: str = None) -> Optional[int]:
+        """
+        Поиск TMDB ID для фильма с кэшированием результата.
+        Отрицательный результат кэшируется как 0 на более короткий срок.
+        """
+        cache_key = make_cache_key('tmdb_id', imdb_id, title, original_title, year)
+        cached_id = cache.get(cache_key)
+        if cached_id is not None:
+            return cached_id or None
+        
+        tmdb_id = single_flight(
+            cache_key,
+            partial(self._search_tmdb_id_for_film, title, original_title, year, imdb_id)
+        )
+        
+        if tmdb_id:
+            cache.set(cache_key, tmdb_id, self.TMDB_ID_CACHE_TIMEOUT)
+        else:
+            cache.set(cache_key, 0, self.TMDB_ID_MISS_CACHE_TIMEOUT)
+        
+        return tmdb_id
+    
+    def _search_tmdb_id_for_film(self, title: str, original_title: str, year: int, imdb_id: str = None) -> Optional[int]:
         """
         Поиск TMDB ID для фильма по разным критериям.
+        Поиск по русскому и оригинальному названию выполняется параллельно,
+        при этом результат по русскому названию остается приоритетным.
         """
         if imdb_id:
             try:
@@ -96,20 +159,24 @@ class MovieService:
         if original_title and original_title != title:
             search_attempts.append((original_title, 'en-US'))
         
-        for search_title, language in search_attempts:
+        search_results_list = gather(
+            *[
+                partial(self.tmdb_service.search_movies, query=search_title, year=year, page=1, language=language)
+                for search_title, language in search_attempts
+            ],
+            return_exceptions=True,
+        )
+        
+        for (search_title, _), search_results in zip(search_attempts, search_results_list):
             try:
-                search_results = self.tmdb_service.search_movies(
-                    query=search_title,
-                    year=year,
-                    page=1,
-                    language=language
-                )
+                if isinstance(search_results, Exception):
+                    raise search_results
                 
                 if search_results.get('results'):
                     first_result = search_results['results'][0]
                     
                     if first_result.get('release_date'):
-                        result_year = int(first_result['release_date'][:4]) if first_result['release_date'] else None
+                        result_year = parse_release_year(first_result['release_date'])
                         if not year or not result_year or abs(result_year - year) <= 2:
                             logger.info(f"Найдено TMDB ID {first_result['id']} для '{search_title}'")
                             return first_result['id']
@@ -119,12 +186,126 @@ class MovieService:
         
         return None
     
-    def get_movie_data(self, kinopoisk_id: int) -> Optional[Dict]:
+    def _get_tmdb_people(self, film_data: Dict) -> Tuple[Optional[int], List[Dict], List[Dict]]:
+        """
+        Поиск фильма в TMDB и получение режиссеров и актеров из credits.
+        Возвращает (tmdb_id, directors, actors); tmdb_id равен None, если credits не найдены.
+        """
+        tmdb_id = self._find_tmdb_id_for_film(
+            title=film_data['title'],
+            original_title=film_data['original_title'],
+            year=film_data['year'],
+            imdb_id=film_data.get('imdb_id')
+        )
+        
+        if not tmdb_id:
+            return None, [], []
+        
+        tmdb_data = self.tmdb_service.get_movie_details(
+            tmdb_id,
+            append_to_response='credits',
+            language='ru-RU'
+        )
+        
+        if not tmdb_data or not tmdb_data.get('credits'):
+            return None, [], []
+        
+        credits = tmdb_data['credits']
+        
+        directors = []
+        for person in credits.get('crew', []):
+            if person.get('job') == 'Director':
+                profile_path = person.get('profile_path')
+                directors.append({
+                    'name': person.get('name', ''),
+                    'photo_url': TMDB_IMAGE_W185 + profile_path if profile_path else None,
+                    'tmdb_id': person.get('id'), 
+                })
+                if len(directors) == 3:
+                    break
+        
+        actors = []
+        for person in credits.get('cast', [])[:10]:
+            profile_path = person.get('profile_path')
+            actors.append({
+                'name': person.get('name', ''),
+                'character': person.get('character', ''),
+                'photo_url': TMDB_IMAGE_W185 + profile_path if profile_path else None,
+                'tmdb_id': person.get('id'),
+            })
+        
+        return tmdb_id, directors, actors
+    
+    def get_movie_data(self, kinopoisk_id: int, imdb_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        Получение полных данных о фильме по Kinopoisk ID с кэшированием.
+        Неудачные попытки кэшируются на короткий срок, чтобы не повторять их сразу.
+        Одновременные запросы одного фильма до заполнения кэша объединяются:
+        внешние API вызывает только первый из них.
+        """
+        cached_data = FilmCacheService.get_film_data(kinopoisk_id)
+        if cached_data:
+            return cached_data
+        
+        missing_key = make_cache_key('film_data_missing', kinopoisk_id)
+        if cache.get(missing_key):
+            return None
+        
+        return single_flight(
+            make_cache_key('film_data_fetch', kinopoisk_id),
+            partial(self._fetch_movie_data, kinopoisk_id, imdb_id, missing_key),
+            self.FILM_DATA_SINGLE_FLIGHT_TIMEOUT
+        )
+    
+    def invalidate_movie_data(self, kinopoisk_id: int) -> None:
+        """
+        Сброс кэша данных фильма, чтобы при следующем просмотре они
+        заново запросились из Кинопоиска и OMDb.
+        Сбрасываемые методы не кэшируются в памяти процесса (local_timeout=0),
+        поэтому обновление сразу видно во всех воркерах.
+        """
+        cached_data = FilmCacheService.get_film_data(kinopoisk_id)
+        if cached_data and cached_data.get('imdb_id'):
+            imdb_id = cached_data['imdb_id']
+            OMDbService.get_movie_by_id.invalidate(imdb_id)
+            OMDbService.get_movie_ratings.invalidate(imdb_id)
+            self.omdb_service.clear_cache_for_request('GET', {'i': imdb_id}, '/')
+        
+        KinopoiskService.get_movie_details.invalidate(kinopoisk_id)
+        FilmCacheService.clear_film_cache(kinopoisk_id)
+        cache.delete(make_cache_key('film_data_missing', kinopoisk_id))
+    
+    def _fetch_movie_data(self, kinopoisk_id: int, imdb_id: Optional[str], missing_key: str) -> Optional[Dict]:
+        """
+        Сбор данных о фильме и сохранение результата (или отметки о неудаче) в кэш.
+        """
+        film_data = self._build_movie_data(kinopoisk_id, imdb_id)
+        
+        if film_data:
+            FilmCacheService.set_film_data(kinopoisk_id, film_data, self.FILM_DATA_CACHE_TIMEOUT)
+        else:
+            cache.set(missing_key, True, self.FILM_DATA_MISS_CACHE_TIMEOUT)
+        
+        return film_data
+    
+    def _build_movie_data(self, kinopoisk_id: int, imdb_id: Optional[str] = None) -> Optional[Dict]:
         """
-        Получение полных данных о фильме по Kinopoisk ID.
+        Сбор полных данных о фильме из внешних API (без обращения к кэшу фильма).
+        Если IMDb ID уже известен (например, из результатов поиска), рейтинги OMDb
+        запрашиваются параллельно с Кинопоиском и используются, если IMDb ID совпал.
         """
         try:
-            kp_details = self.kinopoisk_service.get_movie_details(kinopoisk_id)
+            omdb_prefetch = None
+            if imdb_id:
+                kp_details, omdb_prefetch = gather(
+                    partial(self.kinopoisk_service.get_movie_details, kinopoisk_id),
+                    partial(self.omdb_service.get_movie_ratings, imdb_id),
+                    return_exceptions=True,
+                )
+                if isinstance(kp_details, Exception):
+                    raise kp_details
+            else:
+                kp_details = self.kinopoisk_service.get_movie_details(kinopoisk_id)
             
             if not kp_details:
                 logger.error(f"Нет данных на Кинопоиске для ID {kinopoisk_id}")
@@ -137,108 +318,59 @@ class MovieService:
             
             film_data = {
                 'kinopoisk_id': kinopoisk_id,
-                'title': kp_details.get('nameRu') or kp_details.get('nameOriginal') or kp_details.get('nameEn', ''),
-                'original_title': kp_details.get('nameOriginal') or kp_details.get('nameEn') or kp_details.get('nameRu', ''),
+                'title': _first_value(kp_details, _TITLE_KEYS),
+                'original_title': _first_value(kp_details, _ORIGINAL_TITLE_KEYS),
                 'year': kp_details.get('year'),
                 'description': kp_details.get('description', ''),
                 'poster_url': kp_details.get('posterUrl'),
                 'imdb_id': kp_details.get('imdbId', ''),
                 'runtime': kp_details.get('filmLength'),
-                'genres': [genre['genre'] for genre in kp_details.get('genres', [])],
-                'countries': [country['country'] for country in kp_details.get('countries', [])],
+                'genres': list(map(_get_genre, kp_details.get('genres') or ())),
+                'countries': list(map(_get_country, kp_details.get('countries') or ())),
             }
             
-            ratings = {}
+            ratings = self.kinopoisk_service.get_movie_rating(kp_details)
             
-            kp_rating = kp_details.get('ratingKinopoisk')
-            if kp_rating:
-                ratings['kinopoisk'] = {
-                    'value': float(kp_rating),
-                    'max_value': 10,
-                    'votes': kp_details.get('ratingKinopoiskVoteCount', 0)
-                }
+            prefetch_matched = bool(imdb_id) and film_data['imdb_id'] == imdb_id
             
-            imdb_rating = kp_details.get('ratingImdb')
-            if imdb_rating:
-                ratings['imdb'] = {
-                    'value': float(imdb_rating),
-                    'max_value': 10,
-                    'votes': kp_details.get('ratingImdbVoteCount', 0)
-                }
+            calls = [partial(self._get_tmdb_people, film_data)]
+            if film_data['imdb_id'] and not prefetch_matched:
+                calls.append(partial(self.omdb_service.get_movie_ratings, film_data['imdb_id']))
             
-            try:
-                tmdb_id = self._find_tmdb_id_for_film(
-                    title=film_data['title'],
-                    original_title=film_data['original_title'],
-                    year=film_data['year'],
-                    imdb_id=film_data.get('imdb_id')
-                )
-                
-                if tmdb_id:
-                    tmdb_data = self.tmdb_service.get_movie_details(
-                        tmdb_id,
-                        append_to_response='credits',
-                        language='ru-RU'
-                    )
-                    
-                    if tmdb_data and tmdb_data.get('credits'):
-                        credits = tmdb_data['credits']
-                        film_data['tmdb_id'] = tmdb_id
-                        
-                        directors = []
-                        for person in credits.get('crew', []):
-                            if person.get('job') == 'Director':
-                                profile_path = person.get('profile_path', '')
-                                directors.append({
-                                    'name': person.get('name', ''),
-                                    'photo_url': f"https://image.tmdb.org/t/p/w185{profile_path}" if profile_path else None,
-                                    'tmdb_id': person.get('id'), 
-                                })
-                        film_data['directors'] = directors[:3]
-                        
-                        actors = []
-                        for person in credits.get('cast', [])[:10]:
-                            profile_path = person.get('profile_path', '')
-                            actors.append({
-                                'name': person.get('name', ''),
-                                'character': person.get('character', ''),
-                                'photo_url': f"https://image.tmdb.org/t/p/w185{profile_path}" if profile_path else None,
-                                'tmdb_id': person.get('id'),
-                            })
-                        film_data['actors'] = actors
-                    else:
-                        film_data['directors'] = []
-                        film_data['actors'] = []
-                else:
-                    film_data['directors'] = []
-                    film_data['actors'] = []
-                    
-            except Exception as e:
-                logger.error(f"Ошибка получения данных из TMDB для актеров/режиссеров: {str(e)}")
+            tmdb_people, *omdb_results = gather(*calls, return_exceptions=True)
+            if prefetch_matched:
+                omdb_results.append(omdb_prefetch)
+            
+            if isinstance(tmdb_people, Exception):
+                logger.error(f"Ошибка получения данных из TMDB для актеров/режиссеров: {str(tmdb_people)}")
                 film_data['directors'] = []
                 film_data['actors'] = []
+            else:
+                tmdb_id, film_data['directors'], film_data['actors'] = tmdb_people
+                if tmdb_id:
+                    film_data['tmdb_id'] = tmdb_id
             
-            if film_data['imdb_id']:
-                try:
-                    omdb_ratings = self.omdb_service.get_movie_ratings(film_data['imdb_id'])
-                    
-                    for source, rating in omdb_ratings.items():
-                        if source not in ratings:
-                            ratings[source] = rating
-                            
-                except Exception as e:
-                    logger.error(f"Ошибка получения рейтингов OMDb: {str(e)}")
-            
-            normalized_ratings = []
-            for source, rating in ratings.items():
-                if 'value' in rating and 'max_value' in rating and rating['max_value'] > 0:
-                    normalized_value = (rating['value'] / rating['max_value']) * 10
-                    ratings[source]['normalized_value'] = normalized_value
-                    normalized_ratings.append(normalized_value)
-            
-            if normalized_ratings:
-                avg_rating = sum(normalized_ratings) / len(normalized_ratings)
-                film_data['average_rating'] = round(avg_rating, 2)
+            for omdb_ratings in omdb_results:
+                if isinstance(omdb_ratings, Exception):
+                    logger.error(f"Ошибка получения рейтингов OMDb: {str(omdb_ratings)}")
+                    continue
+                
+                for source, rating in omdb_ratings.items():
+                    if source not in ratings:
+                        ratings[source] = rating
+            
+            normalized_total = 0.0
+            normalized_count = 0
+            for rating in ratings.values():
+                max_value = rating.get('max_value')
+                if max_value and 'value' in rating:
+                    normalized_value = rating['value'] * 10 / max_value
+                    rating['normalized_value'] = normalized_value
+                    normalized_total += normalized_value
+                    normalized_count += 1
+            
+            if normalized_count:
+                film_data['average_rating'] = round(normalized_total / normalized_count, 2)
                 film_data['ratings_count'] = len(ratings)
             else:
                 film_data['average_rating'] = None
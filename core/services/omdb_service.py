@@ -3,9 +3,39 @@ from typing import Optional, Dict
 
 from django.conf import settings
 from .base_api import BaseAPIClient, api_request_logger
+from .cache_utils import cached_json
 
 logger = logging.getLogger(__name__)
 
+OMDB_CACHE_TIMEOUT = 3600 * 12
+
+
+def _is_omdb_miss(data: Dict) -> bool:
+    """OMDb сообщает об ошибке (фильм не найден, неверный ключ) полем Response=False."""
+    return not data or data.get("Response") == "False"
+
+
+def _parse_percent(value: str) -> Optional[Dict]:
+    """Рейтинг вида '87%'."""
+    if "%" not in value:
+        return None
+    return {"value": float(value.replace("%", "")), "max_value": 100}
+
+
+def _parse_fraction(value: str) -> Optional[Dict]:
+    """Рейтинг вида '74/100'."""
+    if "/" not in value:
+        return None
+    val, max_val = value.split("/")
+    return {"value": float(val), "max_value": float(max_val)}
+
+
+# (подстрока в Source, ключ рейтинга, разборщик значения) для массива Ratings
+_RATINGS_PARSERS = (
+    ("Rotten Tomatoes", "rotten_tomatoes", _parse_percent),
+    ("Metacritic", "metacritic", _parse_fraction),
+)
+
 
 class OMDbService(BaseAPIClient):
     """
@@ -13,23 +43,28 @@ class OMDbService(BaseAPIClient):
     """
     
     BASE_URL = "http://www.omdbapi.com"
-    CACHE_TIMEOUT = 3600 * 12 
+    CACHE_TIMEOUT = OMDB_CACHE_TIMEOUT
     
     def setup_session(self):
-        """Настройка сессии для OMDb API"""
+        """Настройка сессии для OMDb API (ключ API добавляется ко всем запросам сессии)"""
         super().setup_session()
+        self.session.params = {"apikey": settings.OMDB_API_KEY}
     
+    def should_cache_response(self, result: Dict) -> bool:
+        """Ошибки OMDb (Response=False) приходят с кодом 200 и не кэшируются."""
+        return not _is_omdb_miss(result)
+    
+    @cached_json(timeout=OMDB_CACHE_TIMEOUT, local_timeout=0, is_miss=_is_omdb_miss)
     @api_request_logger
     def get_movie_by_id(self, imdb_id: str) -> Dict:
         """
         Получение информации о фильме по IMDb ID.
         """
         params = {
-            "i": imdb_id,
-            "apikey": settings.OMDB_API_KEY
+            "i": imdb_id
         }
         
-        return self.get("/", params=params)
+        return self.get("/", params=params, use_cache=False)
     
     @api_request_logger
     def get_movie_by_title(self, title: str) -> Dict:
@@ -37,8 +72,7 @@ class OMDbService(BaseAPIClient):
         Получение информации о фильме по названию.
         """
         params = {
-            "t": title,
-            "apikey": settings.OMDB_API_KEY
+            "t": title
         }
         
         return self.get("/", params=params)
@@ -50,12 +84,12 @@ class OMDbService(BaseAPIClient):
         """
         params = {
             "s": query,
-            "page": page,
-            "apikey": settings.OMDB_API_KEY
+            "page": page
         }
         
         return self.get("/", params=params)
     
+    @cached_json(timeout=OMDB_CACHE_TIMEOUT, local_timeout=0)
     @api_request_logger
     def get_movie_ratings(self, imdb_id: str) -> Dict:
         """
@@ -82,24 +116,14 @@ class OMDbService(BaseAPIClient):
                 "max_value": 100
             }
         
-        if "Ratings" in data:
-            for rating in data["Ratings"]:
-                source = rating["Source"]
-                value = rating["Value"]
-                
-                if "Rotten Tomatoes" in source:
-                    if "%" in value:
-                        ratings["rotten_tomatoes"] = {
-                            "value": float(value.replace("%", "")),
-                            "max_value": 100
-                        }
-                
-                elif "Metacritic" in source:
-                    if "/" in value:
-                        val, max_val = value.split("/")
-                        ratings["metacritic"] = {
-                            "value": float(val),
-                            "max_value": float(max_val)
-                        }
+        for rating in data.get("Ratings") or ():
+            source = rating["Source"]
+            
+            for source_name, key, parse in _RATINGS_PARSERS:
+                if source_name in source:
+                    parsed = parse(rating["Value"])
+                    if parsed:
+                        ratings[key] = parsed
+                    break
         
         return ratings
\ No newline at end of file
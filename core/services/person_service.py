@@ -1,47 +1,54 @@
+import heapq
 import logging
+import threading
+from functools import partial
 from typing import Dict, List, Optional
-from django.core.cache import cache
 
-from .tmdb_service import TMDBService
+from .tmdb_service import TMDBService, TMDB_IMAGE_W185, TMDB_IMAGE_W200, TMDB_IMAGE_H632, parse_release_year
 from .kinopoisk_service import KinopoiskService
+from .base_api import SharedClient
+from .cache_utils import make_cache_key, cache_get_json, cache_set_json
+from .concurrency import gather
 
 logger = logging.getLogger(__name__)
 
+KINOPOISK_MAX_CONCURRENCY = 8
+_kinopoisk_semaphore = threading.BoundedSemaphore(KINOPOISK_MAX_CONCURRENCY)
+
 
 class PersonService:
     """
     Сервис для работы с персонами.
     """
     
-    def __init__(self):
-        self.tmdb_service = TMDBService()
-        self.kinopoisk_service = KinopoiskService()
+    tmdb_service = SharedClient(TMDBService)
+    kinopoisk_service = SharedClient(KinopoiskService)
     
     def get_person_data(self, tmdb_id: int) -> Optional[Dict]:
         """
         Получение всех данных о персоне по TMDB ID.
         """
         try:
-            cache_key = f'person_data_{tmdb_id}'
-            cached_data = cache.get(cache_key)
+            cache_key = make_cache_key('person_data', tmdb_id)
+            cached_data = cache_get_json(cache_key)
             if cached_data:
                 return cached_data
             
-            person_details = self.tmdb_service.get_person_details(tmdb_id)
+            person_details = self.tmdb_service.get_person_full(tmdb_id)
             
             if not person_details:
                 return None
             
-            combined_credits = self.tmdb_service.get_person_combined_credits(tmdb_id)
-            
-            external_ids = self.tmdb_service.get_person_external_ids(tmdb_id)
+            combined_credits = person_details.get('combined_credits') or {}
+            external_ids = person_details.get('external_ids') or {}
             
+            profile_path = person_details.get('profile_path')
             person_data = {
                 'tmdb_id': person_details.get('id'),
                 'name': person_details.get('name', ''),
                 'original_name': person_details.get('original_name', ''),
                 'biography': person_details.get('biography', ''),
-                'photo_url': f"https://image.tmdb.org/t/p/h632{person_details.get('profile_path')}" if person_details.get('profile_path') else None,
+                'photo_url': TMDB_IMAGE_H632 + profile_path if profile_path else None,
                 'birth_date': person_details.get('birthday', ''),
                 'death_date': person_details.get('deathday', ''),
                 'place_of_birth': person_details.get('place_of_birth', ''),
@@ -50,27 +57,32 @@ class PersonService:
                 'popularity': person_details.get('popularity'),
             }
             
-            filmography = []
-            
-            for credit in combined_credits.get('cast', []):
-                if credit.get('media_type') == 'movie': 
-                    film_data = self._format_credit_data(credit, 'actor')
-                    filmography.append(film_data)
-            
-            for credit in combined_credits.get('crew', []):
-                if credit.get('media_type') == 'movie':  
-                    film_data = self._format_credit_data(credit, credit.get('job', 'crew'))
-                    filmography.append(film_data)
-            
-            filmography.sort(key=lambda x: x.get('year', 0) or 0, reverse=True)
-            
-            person_data['filmography'] = filmography[:50]
-            
-            person_data['film_count'] = len(filmography)
-            person_data['actor_roles'] = len([f for f in filmography if f.get('role_type') == 'actor'])
-            person_data['crew_roles'] = len([f for f in filmography if f.get('role_type') != 'actor'])
-            
-            cache.set(cache_key, person_data, 3600 * 24) 
+            cast_credits = [
+                (credit, 'actor')
+                for credit in combined_credits.get('cast', [])
+                if credit.get('media_type') == 'movie'
+            ]
+            crew_credits = [
+                (credit, credit.get('job', 'crew'))
+                for credit in combined_credits.get('crew', [])
+                if credit.get('media_type') == 'movie'
+            ]
+            
+            # Форматируются только 50 самых новых работ, без полной сортировки
+            latest_credits = heapq.nlargest(
+                50,
+                cast_credits + crew_credits,
+                key=lambda item: self._get_credit_year(item[0]),
+            )
+            person_data['filmography'] = [
+                self._format_credit_data(credit, role_type) for credit, role_type in latest_credits
+            ]
+            
+            person_data['film_count'] = len(cast_credits) + len(crew_credits)
+            person_data['actor_roles'] = len(cast_credits) + sum(1 for _, role_type in crew_credits if role_type == 'actor')
+            person_data['crew_roles'] = person_data['film_count'] - person_data['actor_roles']
+            
+            cache_set_json(cache_key, person_data, 3600 * 24) 
             
             return person_data
             
@@ -78,28 +90,31 @@ class PersonService:
             logger.error(f"Ошибка получения данных от TMDB ID {tmdb_id}: {str(e)}")
             return None
     
+    @staticmethod
+    def _get_credit_year(credit: Dict) -> int:
+        """
+        Год выхода фильма из release_date (0, если дата неизвестна).
+        """
+        return parse_release_year(credit.get('release_date')) or 0
+    
     def _format_credit_data(self, credit: Dict, role_type: str) -> Dict:
         """
         Форматирование данных о работе в фильме.
         """
-        release_date = credit.get('release_date', '')
-        year = int(release_date[:4]) if release_date and len(release_date) >= 4 else None
-        
-        poster_path = credit.get('poster_path', '')
-        poster_url = f"https://image.tmdb.org/t/p/w200{poster_path}" if poster_path else None
-        
-        role = credit.get('character', '') if role_type == 'actor' else credit.get('job', '')
+        get = credit.get
+        release_date = get('release_date', '')
+        poster_path = get('poster_path')
         
         return {
-            'tmdb_id': credit.get('id'),
-            'title': credit.get('title', ''),
-            'original_title': credit.get('original_title', ''),
-            'year': year,
-            'poster_url': poster_url,
-            'role': role,
+            'tmdb_id': get('id'),
+            'title': get('title', ''),
+            'original_title': get('original_title', ''),
+            'year': self._get_credit_year(credit) or None,
+            'poster_url': TMDB_IMAGE_W200 + poster_path if poster_path else None,
+            'role': get('character', '') if role_type == 'actor' else get('job', ''),
             'role_type': role_type,
-            'vote_average': credit.get('vote_average'),
-            'vote_count': credit.get('vote_count'),
+            'vote_average': get('vote_average'),
+            'vote_count': get('vote_count'),
             'release_date': release_date,
         }
     
@@ -108,8 +123,8 @@ class PersonService:
         Поиск персоны по имени.
         """
         try:
-            cache_key = f'person_search_{name}'
-            cached_results = cache.get(cache_key)
+            cache_key = make_cache_key('person_search', ' '.join(name.casefold().split()))
+            cached_results = cache_get_json(cache_key)
             if cached_results:
                 return cached_results
             
@@ -120,18 +135,19 @@ class PersonService:
                 if not result.get('id'):
                     continue
                 
+                profile_path = result.get('profile_path')
                 person = {
                     'tmdb_id': result.get('id'),
                     'name': result.get('name', ''),
                     'original_name': result.get('original_name', ''),
-                    'photo_url': f"https://image.tmdb.org/t/p/w185{result.get('profile_path')}" if result.get('profile_path') else None,
+                    'photo_url': TMDB_IMAGE_W185 + profile_path if profile_path else None,
                     'known_for_department': result.get('known_for_department', ''),
                     'popularity': result.get('popularity'),
                     'known_for': result.get('known_for', []),
                 }
                 persons.append(person)
             
-            cache.set(cache_key, persons, 300)  
+            cache_set_json(cache_key, persons, 300)  
             return persons
             
         except Exception as e:
@@ -140,37 +156,46 @@ class PersonService:
     
     def get_person_filmography_with_ratings(self, tmdb_id: int) -> List[Dict]:
         """
-        Получение фильмографии с рейтингами (использует MovieService для получения рейтингов).
+        Получение фильмографии с рейтингами Кинопоиска.
+        Поиск фильмов на Кинопоиске выполняется параллельно.
         """
-        from .movie_service import MovieService
-        
         try:
             person_data = self.get_person_data(tmdb_id)
             if not person_data or 'filmography' not in person_data:
                 return []
             
             filmography = person_data['filmography']
-            movie_service = MovieService()
-            
-            for film in filmography[:20]: 
-                if film.get('tmdb_id'):
-                    try:
-                        search_results = self.kinopoisk_service.search_movies(
-                            film['title'], 
-                            year=film.get('year'),
-                            page=1
-                        )
-                        
-                        if search_results.get('items'):
-                            kp_film = search_results['items'][0]
-                            film['kinopoisk_id'] = kp_film.get('kinopoiskId')
-                            film['rating_kinopoisk'] = kp_film.get('ratingKinopoisk')
-                            film['rating_imdb'] = kp_film.get('ratingImdb')
-                    except Exception as e:
-                        continue
+            films = [film for film in filmography[:20] if film.get('tmdb_id')]
+            
+            matches = gather(
+                *[partial(self._find_kinopoisk_match, film) for film in films],
+                return_exceptions=True,
+            )
+            
+            for film, kp_film in zip(films, matches):
+                if not kp_film or isinstance(kp_film, Exception):
+                    continue
+                film['kinopoisk_id'] = kp_film.get('kinopoiskId')
+                film['rating_kinopoisk'] = kp_film.get('ratingKinopoisk')
+                film['rating_imdb'] = kp_film.get('ratingImdb')
             
             return filmography
             
         except Exception as e:
             logger.error(f"Ошибка получения фильмографии для персоны с ID {tmdb_id}: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+    
+    def _find_kinopoisk_match(self, film: Dict) -> Optional[Dict]:
+        """
+        Поиск фильма из фильмографии на Кинопоиске (первый результат поиска).
+        Число одновременных запросов ограничено KINOPOISK_MAX_CONCURRENCY.
+        """
+        with _kinopoisk_semaphore:
+            search_results = self.kinopoisk_service.search_movies(
+                film['title'], 
+                year=film.get('year'),
+                page=1
+            )
+        
+        items = search_results.get('items')
+        return items[0] if items else None
\ No newline at end of file
@@ -47,18 +47,18 @@ class RatingCalculator:
                 'metacritic': 0.25
             }
         
-        weighted_sum = Decimal('0')
-        total_weight = Decimal('0')
+        # Промежуточные вычисления во float, в Decimal переводится только итог
+        weighted_sum = 0.0
+        total_weight = 0.0
         
         for rating in film.ratings.all():
-            source = rating.source
-            if source in weights and rating.normalized_value:
-                weight = Decimal(str(weights[source]))
-                weighted_sum += rating.normalized_value * weight
+            weight = weights.get(rating.source)
+            if weight and rating.normalized_value:
+                weighted_sum += float(rating.normalized_value) * weight
                 total_weight += weight
         
         if total_weight > 0:
-            return (weighted_sum / total_weight).quantize(Decimal('0.01'))
+            return Decimal(weighted_sum / total_weight).quantize(Decimal('0.01'))
         return None
     
     @staticmethod
@@ -72,9 +72,11 @@ class RatingCalculator:
         Returns:
             dict: Статистика по рейтингам
         """
-        ratings = film.ratings.all()
+        # Один проход по списку: при prefetch_related('ratings') запросов к БД нет,
+        # без него выполняется один SELECT (вместо COUNT + SELECT)
+        ratings = list(film.ratings.all())
         stats = {
-            'sources_count': ratings.count(),
+            'sources_count': len(ratings),
             'sources': {},
             'min_rating': None,
             'max_rating': None,
@@ -1,26 +1,35 @@
 import logging
+import threading
+from functools import partial
 from typing import Dict, List, Optional, Tuple
+from celery import group
 from django.db import transaction
-from django.utils import timezone
 
-from ..models import Film, Person, FilmPersonRole, Rating
-from .tmdb_service import TMDBService
+from ..models import Film
+from .tmdb_service import TMDBService, TMDB_IMAGE_ORIGINAL, parse_release_year
 from .omdb_service import OMDbService
 from .kinopoisk_service import KinopoiskService
+from .base_api import SharedClient
+from .bulk_utils import BULK_BATCH_SIZE, save_ratings_bulk, upsert_persons_bulk
+from .concurrency import gather
+from .rating_calculator import RatingCalculator
 from ..tasks import update_film_ratings, update_person_data
 
 logger = logging.getLogger(__name__)
 
+TMDB_MAX_CONCURRENCY = 10
+FILM_TMDB_FIELDS = ('title', 'original_title', 'year', 'description', 'poster_url', 'imdb_id')
+_tmdb_semaphore = threading.BoundedSemaphore(TMDB_MAX_CONCURRENCY)
+
 
 class SearchService:
     """
     Сервис для управления логикой поиска фильмов.
     """
     
-    def __init__(self):
-        self.tmdb_service = TMDBService()
-        self.omdb_service = OMDbService()
-        self.kinopoisk_service = KinopoiskService()
+    tmdb_service = SharedClient(TMDBService)
+    omdb_service = SharedClient(OMDbService)
+    kinopoisk_service = SharedClient(KinopoiskService)
     
     def search_and_import_film(self, tmdb_id: int) -> Tuple[Film, bool]:
         """
@@ -32,204 +41,187 @@ class SearchService:
         Returns:
             Tuple[Film, bool]: (объект фильма, создан ли новый)
         """
-        film = Film.objects.filter(tmdb_id=tmdb_id).first()
+        film = Film.objects.filter(tmdb_id=tmdb_id).only('id', 'title', 'composite_rating').first()
         
         if film:
             logger.info(f"Фильм уже существует: {film.title} (ID: {film.id})")
             return film, False
         
+        movie_data = self._fetch_movie_details(tmdb_id)
+        
+        return self._import_movie_data(movie_data), True
+    
+    def _fetch_movie_details(self, tmdb_id: int) -> Dict:
+        """
+        Получение данных фильма вместе с составом из TMDB.
+        Одновременно выполняется не больше TMDB_MAX_CONCURRENCY запросов,
+        чтобы пакетный импорт не упирался в лимит запросов TMDB.
+        """
         logger.info(f"Получаем данные из TMDB для ID: {tmdb_id}")
-        movie_data = self.tmdb_service.get_movie_details(
-            tmdb_id,
-            append_to_response='credits',
-            language='ru-RU'
-        )
+        with _tmdb_semaphore:
+            movie_data = self.tmdb_service.get_movie_details(
+                tmdb_id,
+                append_to_response='credits',
+                language='ru-RU'
+            )
         
         if not movie_data:
             raise ValueError(f"Нет данных для TMDB ID: {tmdb_id}")
         
-        film = self._create_film_from_tmdb(movie_data)
+        return movie_data
+    
+    def _fetch_import_data(self, tmdb_id: int, movie_data: Optional[Dict] = None) -> Tuple[Dict, Dict]:
+        """
+        Загрузка данных фильма из TMDB (если они не переданы) и его рейтингов без записи в БД.
+        В пакетном импорте выполняется для всех фильмов параллельно, поэтому
+        рейтинги одних фильмов запрашиваются, пока загружаются данные других.
+        Фильмы без года выпуска (поле year обязательно) отклоняются до записи в БД,
+        чтобы один такой фильм не прерывал сохранение всей пачки.
+        """
+        if movie_data is None:
+            movie_data = self._fetch_movie_details(tmdb_id)
+        
+        film = self._build_film_from_tmdb(movie_data)
+        if film.year is None:
+            raise ValueError(f"Не указан год выпуска для TMDB ID: {tmdb_id}")
         
-        self._fetch_and_save_ratings(film)
+        return movie_data, self._fetch_ratings(film)
+    
+    def _import_movie_data(self, movie_data: Dict) -> Film:
+        """
+        Сохранение фильма из данных TMDB вместе с рейтингами и персонами.
+        Рейтинги запрашиваются до начала записи, все изменения в БД
+        выполняются в одной транзакции.
+        """
+        ratings_data = self._fetch_ratings(self._build_film_from_tmdb(movie_data))
         
-        self._update_persons_data(film, movie_data.get('credits', {}))
+        with transaction.atomic():
+            film = self._create_film_from_tmdb(movie_data)
+            save_ratings_bulk({film: ratings_data})
+            self._update_composite_rating(film)
+            self._update_persons_data(film, movie_data.get('credits', {}))
         
         logger.info(f"Успешно загружен фильм: {film.title} (ID: {film.id})")
         
-        return film, True
+        return film
     
     def _create_film_from_tmdb(self, movie_data: Dict) -> Film:
         """
         Создание объекта Film из данных TMDB.
         """
-        release_date = movie_data.get('release_date', '')
-        year = int(release_date[:4]) if release_date and len(release_date) >= 4 else None
-        
+        return self._create_films_from_tmdb_bulk([movie_data])[movie_data.get('id')]
+    
+    @staticmethod
+    def _build_film_from_tmdb(movie_data: Dict) -> Film:
+        """
+        Несохраненный объект Film по данным TMDB.
+        """
         poster_path = movie_data.get('poster_path')
-        poster_url = f"https://image.tmdb.org/t/p/original{poster_path}" if poster_path else None
+        poster_url = TMDB_IMAGE_ORIGINAL + poster_path if poster_path else None
         
-        film, created = Film.objects.get_or_create(
+        return Film(
             tmdb_id=movie_data.get('id'),
-            defaults={
-                'title': movie_data.get('title', ''),
-                'original_title': movie_data.get('original_title', ''),
-                'year': year,
-                'description': movie_data.get('overview', ''),
-                'poster_url': poster_url,
-                'imdb_id': movie_data.get('imdb_id', '')
-            }
+            title=movie_data.get('title', ''),
+            original_title=movie_data.get('original_title', ''),
+            year=parse_release_year(movie_data.get('release_date')),
+            description=movie_data.get('overview', ''),
+            poster_url=poster_url,
+            imdb_id=movie_data.get('imdb_id', '')
         )
+    
+    def _create_films_from_tmdb_bulk(self, movie_data_list: List[Dict]) -> Dict[int, Film]:
+        """
+        Создание или обновление фильмов из данных TMDB одним запросом.
         
-        if not created:
-            film.title = movie_data.get('title', '')
-            film.original_title = movie_data.get('original_title', '')
-            film.year = year
-            film.description = movie_data.get('overview', '')
-            film.poster_url = poster_url
-            film.imdb_id = movie_data.get('imdb_id', '')
-            film.save()
+        Returns:
+            Dict[int, Film]: сохраненные фильмы по TMDB ID
+        """
+        films = [self._build_film_from_tmdb(movie_data) for movie_data in movie_data_list]
         
-        return film
+        Film.objects.bulk_create(
+            films,
+            update_conflicts=True,
+            unique_fields=['tmdb_id'],
+            update_fields=[*FILM_TMDB_FIELDS, 'updated_at'],
+            batch_size=BULK_BATCH_SIZE
+        )
+        
+        return Film.objects.in_bulk([film.tmdb_id for film in films], field_name='tmdb_id')
     
     def _fetch_and_save_ratings(self, film: Film) -> None:
         """
         Получение и сохранение рейтингов для фильма.
         """
-        ratings_data = {}
+        save_ratings_bulk({film: self._fetch_ratings(film)})
         
-        if film.imdb_id:
-            try:
-                omdb_ratings = self.omdb_service.get_movie_ratings(film.imdb_id)
-                ratings_data.update(omdb_ratings)
-            except Exception as e:
-                logger.error(f"Ошибка получения рейтингов OMDb для {film.title}: {str(e)}")
+        self._update_composite_rating(film)
+    
+    def _fetch_ratings(self, film: Film) -> Dict:
+        """
+        Получение рейтингов фильма из OMDb и Кинопоиска.
+        OMDb и поиск фильма в Кинопоиске выполняются параллельно.
+        """
+        ratings_data = {}
         
-        try:
-            kinopoisk_movie = self.kinopoisk_service.get_movie_by_imdb_id(
-                film.imdb_id, 
-                film_title=film.title,
-                year=film.year
-            )
-            
-            if kinopoisk_movie:
-                kp_ratings = self.kinopoisk_service.get_movie_rating(kinopoisk_movie)
-                
-                if 'kinopoisk' in kp_ratings:
-                    ratings_data['kinopoisk'] = kp_ratings['kinopoisk']
-                
-                if 'imdb' in kp_ratings and 'imdb' not in ratings_data:
-                    ratings_data['imdb'] = kp_ratings['imdb']
-            else:
-                logger.warning(f"Фильм не найден в Кинопоиске: {film.title} (IMDb: {film.imdb_id})")
-                
-        except Exception as e:
-            logger.error(f"Ошибка получения рейтингов Кинопоиска для {film.title}: {str(e)}")
+        omdb_ratings, kinopoisk_movie = gather(
+            partial(self.omdb_service.get_movie_ratings, film.imdb_id) if film.imdb_id else dict,
+            partial(self.kinopoisk_service.resolve, film.imdb_id, film.title, film.year),
+            return_exceptions=True
+        )
         
-        if 'kinopoisk' not in ratings_data and film.title:
-            try:
-                search_results = self.kinopoisk_service.search_movies(
-                    film.title, 
-                    year=film.year,
-                    page=1
-                )
-                
-                if "items" in search_results and search_results["items"]:
-                    kinopoisk_movie = search_results["items"][0]
-                    kp_ratings = self.kinopoisk_service.get_movie_rating(kinopoisk_movie)
-                    
-                    if 'kinopoisk' in kp_ratings:
-                        ratings_data['kinopoisk'] = kp_ratings['kinopoisk']
-                        
-            except Exception as e:
-                logger.error(f"Ошибка поиска по названию в Кинопоиске для {film.title}: {str(e)}")
+        if isinstance(omdb_ratings, Exception):
+            logger.error(f"Ошибка получения рейтингов OMDb для {film.title}: {str(omdb_ratings)}")
+        else:
+            ratings_data.update(omdb_ratings)
         
-        self._save_ratings_to_db(film, ratings_data)
+        if isinstance(kinopoisk_movie, Exception):
+            logger.error(f"Ошибка получения рейтингов Кинопоиска для {film.title}: {str(kinopoisk_movie)}")
+        elif kinopoisk_movie:
+            kp_ratings = self.kinopoisk_service.get_movie_rating(kinopoisk_movie)
+            
+            if 'kinopoisk' in kp_ratings:
+                ratings_data['kinopoisk'] = kp_ratings['kinopoisk']
+            
+            if 'imdb' in kp_ratings and 'imdb' not in ratings_data:
+                ratings_data['imdb'] = kp_ratings['imdb']
+        else:
+            logger.warning(f"Фильм не найден в Кинопоиске: {film.title} (IMDb: {film.imdb_id})")
         
-        from .rating_calculator import RatingCalculator
+        return ratings_data
+    
+    def _update_composite_rating(self, film: Film) -> None:
+        """
+        Пересчет сводного рейтинга фильма по сохраненным рейтингам.
+        """
         composite_rating = RatingCalculator.calculate_composite_rating(film)
         if composite_rating:
             film.composite_rating = composite_rating
             film.save(update_fields=['composite_rating'])
     
-    def _save_ratings_to_db(self, film: Film, ratings_data: Dict) -> None:
-        """
-        Сохранение рейтингов в базу данных.
-        """
-        source_mapping = {
-            'imdb': Rating.SourceChoices.IMDB,
-            'rotten_tomatoes': Rating.SourceChoices.ROTTEN_TOMATOES,
-            'metacritic': Rating.SourceChoices.METACRITIC,
-            'kinopoisk': Rating.SourceChoices.KINOPOISK
-        }
-        
-        for source_key, rating_data in ratings_data.items():
-            if source_key in source_mapping:
-                Rating.objects.update_or_create(
-                    film=film,
-                    source=source_mapping[source_key],
-                    defaults={
-                        'value': rating_data['value'],
-                        'max_value': rating_data['max_value'],
-                        'votes_count': rating_data.get('votes', None),
-                        'last_updated': timezone.now()
-                    }
-                )
-    
     def _update_persons_data(self, film: Film, credits_data: Dict) -> None:
         """
         Обновление данных о персонах фильма.
         """
-        crew = credits_data.get('crew', [])
-        directors = [person for person in crew if person.get('job') == 'Director']
-        
-        for director_data in directors[:3]:  
-            self._add_person_to_film(film, director_data, 'director')
-        
-        cast = credits_data.get('cast', [])[:15]
-        
-        for i, actor_data in enumerate(cast):
-            self._add_person_to_film(film, actor_data, 'actor', character_name=actor_data.get('character'), order=i)
+        self._bulk_upsert_persons([(film, credits_data)])
     
-    def _add_person_to_film(self, film: Film, person_data: Dict, role: str, 
-                           character_name: Optional[str] = None, order: int = 0) -> None:
+    def _bulk_upsert_persons(self, film_credits: List[Tuple[Film, Dict]]) -> None:
         """
-        Добавление персоны к фильму.
+        Добавление режиссеров и актеров к фильмам (не больше 3 режиссеров и 15 актеров).
+        Для только что созданных персон после коммита ставится задача загрузки полных данных.
         """
-        person_id = person_data.get('id')
-        if not person_id:
-            return
-        
-        person, created = Person.objects.get_or_create(
-            tmdb_id=person_id,
-            defaults={
-                'name': person_data.get('name', ''),
-                'original_name': person_data.get('original_name', ''),
-                'profession': Person.ProfessionChoices.DIRECTOR if role == 'director' else Person.ProfessionChoices.ACTOR
-            }
-        )
-        
-        role_mapping = {
-            'actor': FilmPersonRole.RoleChoices.ACTOR,
-            'director': FilmPersonRole.RoleChoices.DIRECTOR
-        }
-        
-        if role in role_mapping:
-            FilmPersonRole.objects.get_or_create(
-                film=film,
-                person=person,
-                role=role_mapping[role],
-                defaults={
-                    'character_name': character_name,
-                    'order': order
-                }
+        new_person_ids = upsert_persons_bulk(film_credits, max_directors=3, max_cast=15)
+        if new_person_ids:
+            transaction.on_commit(
+                group(update_person_data.s(person_id) for person_id in new_person_ids).apply_async
             )
-        
-        if created:
-            update_person_data.delay(person.id)
     
     def batch_import_films(self, tmdb_ids: List[int]) -> Dict:
         """
         Пакетный импорт фильмов.
+        Уже сохраненные фильмы находятся одним запросом к БД, данные и рейтинги
+        остальных загружаются параллельно. Новые фильмы, их рейтинги и персоны
+        сохраняются пачками в одной транзакции; если она откатилась,
+        все загруженные фильмы пакета попадают в статистику как failed.
         
         Args:
             tmdb_ids (List[int]): Список TMDB ID
@@ -245,11 +237,51 @@ class SearchService:
             'details': []
         }
         
+        existing_films = Film.objects.only('id', 'tmdb_id', 'title').in_bulk(tmdb_ids, field_name='tmdb_id')
+        missing_ids = [tmdb_id for tmdb_id in dict.fromkeys(tmdb_ids) if tmdb_id not in existing_films]
+        cached_details = self.tmdb_service.get_movies_details_bulk(
+            missing_ids,
+            append_to_response='credits',
+            language='ru-RU',
+            fetch_missing=False
+        )
+        fetched = dict(zip(missing_ids, gather(
+            *[partial(self._fetch_import_data, tmdb_id, cached_details.get(tmdb_id)) for tmdb_id in missing_ids],
+            return_exceptions=True
+        )))
+        loaded = [result for result in fetched.values() if not isinstance(result, Exception)]
+        movies = [movie_data for movie_data, _ in loaded]
+        ratings_by_tmdb_id = {movie_data.get('id'): ratings_data for movie_data, ratings_data in loaded}
+        
+        try:
+            with transaction.atomic():
+                imported_films = self._create_films_from_tmdb_bulk(movies)
+                save_ratings_bulk({
+                    film: ratings_by_tmdb_id[tmdb_id] for tmdb_id, film in imported_films.items()
+                })
+                for film in imported_films.values():
+                    self._update_composite_rating(film)
+                self._bulk_upsert_persons([
+                    (imported_films[movie_data.get('id')], movie_data.get('credits', {})) for movie_data in movies
+                ])
+        except Exception as e:
+            # Транзакция откатилась целиком: все загруженные фильмы пакета считаются неимпортированными
+            logger.error(f"Ошибка сохранения пакета фильмов: {str(e)}")
+            imported_films = {}
+            fetched = {tmdb_id: result if isinstance(result, Exception) else e for tmdb_id, result in fetched.items()}
+        
         for tmdb_id in tmdb_ids:
             try:
-                film, created = self.search_and_import_film(tmdb_id)
+                film = existing_films.get(tmdb_id)
                 
-                if created:
+                if film is None:
+                    result = fetched[tmdb_id]
+                    if isinstance(result, Exception):
+                        raise result
+                    movie_data = result[0]
+                    film = existing_films[tmdb_id] = imported_films[movie_data.get('id')]
+                    logger.info(f"Успешно загружен фильм: {film.title} (ID: {film.id})")
+                    
                     stats['imported'] += 1
                     stats['details'].append({
                         'tmdb_id': tmdb_id,
@@ -1,11 +1,31 @@
 import logging
-from typing import Optional, Dict
+from functools import partial
+from typing import Optional, Dict, List
 
 from django.conf import settings
+from django.core.cache import cache
 from .base_api import BaseAPIClient, api_request_logger
+from .cache_utils import cached_json
+from .concurrency import gather
 
 logger = logging.getLogger(__name__)
 
+TMDB_CACHE_TIMEOUT = 3600 * 24
+
+TMDB_IMAGE_W185 = "https://image.tmdb.org/t/p/w185"
+TMDB_IMAGE_W200 = "https://image.tmdb.org/t/p/w200"
+TMDB_IMAGE_W500 = "https://image.tmdb.org/t/p/w500"
+TMDB_IMAGE_H632 = "https://image.tmdb.org/t/p/h632"
+TMDB_IMAGE_ORIGINAL = "https://image.tmdb.org/t/p/original"
+
+
+def parse_release_year(release_date: Optional[str]) -> Optional[int]:
+    """
+    Год из даты выхода TMDB ('YYYY-MM-DD'); None, если дата пустая или неполная ('TBA').
+    """
+    year = (release_date or '')[:4]
+    return int(year) if len(year) == 4 and year.isdigit() else None
+
 
 class TMDBService(BaseAPIClient):
     """
@@ -13,7 +33,7 @@ class TMDBService(BaseAPIClient):
     """
     
     BASE_URL = "https://api.themoviedb.org/3"
-    CACHE_TIMEOUT = 3600 * 24 
+    CACHE_TIMEOUT = TMDB_CACHE_TIMEOUT
     
     def setup_session(self):
         """Настройка сессии для TMDB API"""
@@ -37,21 +57,24 @@ class TMDBService(BaseAPIClient):
         if year:
             params["year"] = year
             
-        return self.get("search/movie", params=params)
+        return self.get("search/movie", params=params, use_cache=True)
     
+    @cached_json(timeout=TMDB_CACHE_TIMEOUT)
     @api_request_logger
-    def get_movie_details(self, tmdb_id: int, append_to_response: Optional[str] = None, language: str = 'ru-RU') -> Optional[Dict]:
+    def get_movie_details(self, tmdb_id: int, append_to_response: Optional[str] = None, language: str = 'ru-RU',
+                          validate_id: bool = True) -> Optional[Dict]:
         """
         Получение детальной информации о фильме.
+        При validate_id=False ответ с чужим ID не отбрасывается (проверку делает вызывающий код).
         """
         params = {"language": language}
         if append_to_response:
             params["append_to_response"] = append_to_response
             
         try:
-            result = self.get(f"movie/{tmdb_id}", params=params)
+            result = self.get(f"movie/{tmdb_id}", params=params, use_cache=False)
             
-            if not result or result.get('id') != tmdb_id:
+            if not result or (validate_id and result.get('id') != tmdb_id):
                 logger.warning(f"TMDB вернул не те данные для ID {tmdb_id}. Ожидалось: {tmdb_id}, вернулось: {result.get('id') if result else 'None'}")
                 return None
             
@@ -61,6 +84,31 @@ class TMDBService(BaseAPIClient):
             logger.error(f"Ошибка получения данных для {tmdb_id}: {str(e)}")
             return None
     
+    def get_movies_details_bulk(self, tmdb_ids: List[int], append_to_response: Optional[str] = None,
+                                language: str = 'ru-RU', fetch_missing: bool = True) -> Dict[int, Dict]:
+        """
+        Детальная информация о нескольких фильмах по TMDB ID.
+        Кэш get_movie_details читается одним запросом get_many, отсутствующие в нем
+        фильмы загружаются из API параллельно (при fetch_missing=False не загружаются).
+        Фильмы, для которых данных нет, в результат не попадают.
+        """
+        call_kwargs = {'append_to_response': append_to_response, 'language': language}
+        keys = {
+            tmdb_id: TMDBService.get_movie_details.cache_key(tmdb_id, **call_kwargs)
+            for tmdb_id in tmdb_ids
+        }
+        cached = cache.get_many(list(keys.values()))
+        results = {tmdb_id: cached[key] for tmdb_id, key in keys.items() if cached.get(key)}
+        
+        if fetch_missing:
+            missing_ids = [tmdb_id for tmdb_id in keys if tmdb_id not in results]
+            fetched = gather(*[partial(self.get_movie_details, tmdb_id, **call_kwargs) for tmdb_id in missing_ids])
+            for tmdb_id, movie_data in zip(missing_ids, fetched):
+                if movie_data:
+                    results[tmdb_id] = movie_data
+        
+        return results
+    
     @api_request_logger
     def find_by_imdb_id(self, imdb_id: str, language: str = 'ru-RU') -> Dict:
         """
@@ -71,7 +119,7 @@ class TMDBService(BaseAPIClient):
             "language": language
         }
         
-        return self.get(f"find/{imdb_id}", params=params)
+        return self.get(f"find/{imdb_id}", params=params, use_cache=True)
     
     @api_request_logger
     def search_person(self, query: str, page: int = 1, language: str = 'ru-RU') -> Dict:
@@ -85,11 +133,11 @@ class TMDBService(BaseAPIClient):
             "include_adult": "false"
         }
         
-        return self.get("search/person", params=params)
+        return self.get("search/person", params=params, use_cache=True)
     
     @api_request_logger
     def get_person_details(self, person_id: int, append_to_response: Optional[str] = None,
-                          language: str = 'ru-RU') -> Dict:
+                          language: str = 'ru-RU', use_cache: bool = False) -> Dict:
         """
         Получение детальной информации о персоне.
         """
@@ -97,7 +145,7 @@ class TMDBService(BaseAPIClient):
         if append_to_response:
             params["append_to_response"] = append_to_response
             
-        return self.get(f"person/{person_id}", params=params)
+        return self.get(f"person/{person_id}", params=params, use_cache=use_cache)
     
     @api_request_logger
     def get_person_combined_credits(self, person_id: int, language: str = 'ru-RU') -> Dict:
@@ -111,4 +159,13 @@ class TMDBService(BaseAPIClient):
         """
         Получение внешних идентификаторов персоны (IMDb, etc).
         """
-        return self.get(f"person/{person_id}/external_ids")
\ No newline at end of file
+        return self.get(f"person/{person_id}/external_ids")
+    
+    def get_person_full(self, person_id: int, language: str = 'ru-RU') -> Dict:
+        """
+        Получение данных о персоне вместе с фильмографией и внешними идентификаторами
+        одним запросом (ключи 'combined_credits' и 'external_ids').
+        Используется для отображения страницы персоны, поэтому ответ кэшируется.
+        """
+        return self.get_person_details(person_id, append_to_response='combined_credits,external_ids',
+                                       language=language, use_cache=True)
\ No newline at end of file
@@ -6,9 +6,12 @@ from celery import shared_task
 from django.db import transaction
 from django.utils import timezone
 
-from .models import Film, Person, Rating
+from .models import Film, Person
 from .services import TMDBService, OMDbService, KinopoiskService, RatingCalculator
-from .services.base_api import APIRateLimitError, APIRequestError
+from .services.base_api import APIRateLimitError, APIRequestError, shared_client
+from .services.tmdb_service import parse_release_year
+from .services.cache_utils import bypass_cache_reads
+from .services.bulk_utils import RATING_SOURCE_MAPPING, save_ratings_bulk, upsert_persons_bulk
 
 logger = logging.getLogger(__name__)
 
@@ -20,9 +23,11 @@ logger = logging.getLogger(__name__)
     retry_kwargs={'max_retries': 3},
     default_retry_delay=60
 )
+@bypass_cache_reads()
 def update_film_ratings(self, film_id: int) -> dict:
     """
     Задача для обновления рейтингов фильма из различных источников.
+    Ответы OMDb и Кинопоиска запрашиваются заново, кэш только обновляется.
     """
     try:
         film = Film.objects.get(id=film_id)
@@ -32,11 +37,9 @@ def update_film_ratings(self, film_id: int) -> dict:
     
     logger.info(f"Начало обновления рейтингов для: {film.title} (ID: {film_id})")
     
-    from ..services import TMDBService, OMDbService, KinopoiskService, RatingCalculator
-    
-    tmdb_service = TMDBService()
-    omdb_service = OMDbService()
-    kinopoisk_service = KinopoiskService()
+    tmdb_service = shared_client(TMDBService)
+    omdb_service = shared_client(OMDbService)
+    kinopoisk_service = shared_client(KinopoiskService)
     
     stats = {
         'film_id': film_id,
@@ -47,36 +50,16 @@ def update_film_ratings(self, film_id: int) -> dict:
     }
     
     try:
+        ratings_to_save = {}
+        
         if film.imdb_id:
             try:
                 omdb_ratings = omdb_service.get_movie_ratings(film.imdb_id)
                 
                 for source_name, rating_data in omdb_ratings.items():
-                    source_mapping = {
-                        'imdb': Rating.SourceChoices.IMDB,
-                        'rotten_tomatoes': Rating.SourceChoices.ROTTEN_TOMATOES,
-                        'metacritic': Rating.SourceChoices.METACRITIC
-                    }
-                    
-                    if source_name in source_mapping:
-                        source = source_mapping[source_name]
-                        rating, created = Rating.objects.update_or_create(
-                            film=film,
-                            source=source,
-                            defaults={
-                                'value': rating_data['value'],
-                                'max_value': rating_data['max_value'],
-                                'votes_count': rating_data.get('votes', None)
-                            }
-                        )
-                        
-                        if created:
-                            stats['ratings_created'] += 1
-                        else:
-                            stats['ratings_updated'] += 1
-                        
-                        stats['sources'].append(source)
-                        logger.debug(f"Обновлены рейтинги из {source} для {film.title}: {rating_data['value']}")
+                    if source_name in RATING_SOURCE_MAPPING:
+                        ratings_to_save[source_name] = rating_data
+                        logger.debug(f"Получены рейтинги из {source_name} для {film.title}: {rating_data['value']}")
             except Exception as e:
                 logger.error(f"Ошибка обновления рейтингов OMDb для {film.title}: {str(e)}")
         
@@ -104,44 +87,27 @@ def update_film_ratings(self, film_id: int) -> dict:
                 
                 if 'kinopoisk' in kp_ratings:
                     rating_data = kp_ratings['kinopoisk']
-                    rating, created = Rating.objects.update_or_create(
-                        film=film,
-                        source=Rating.SourceChoices.KINOPOISK,
-                        defaults={
-                            'value': rating_data['value'],
-                            'max_value': rating_data['max_value'],
-                            'votes_count': rating_data.get('votes', 0)
-                        }
-                    )
-                    
-                    if created:
-                        stats['ratings_created'] += 1
-                    else:
-                        stats['ratings_updated'] += 1
-                    
-                    stats['sources'].append(Rating.SourceChoices.KINOPOISK)
-                    logger.debug(f"Обновлены рейтинги Кинопоиска для {film.title}: {rating_data['value']}")
+                    ratings_to_save['kinopoisk'] = rating_data
+                    logger.debug(f"Получены рейтинги Кинопоиска для {film.title}: {rating_data['value']}")
                     
                 if 'imdb' in kp_ratings and film.imdb_id:
-                    rating_data = kp_ratings['imdb']
-                    rating, created = Rating.objects.update_or_create(
-                        film=film,
-                        source=Rating.SourceChoices.IMDB,
-                        defaults={
-                            'value': rating_data['value'],
-                            'max_value': rating_data['max_value'],
-                            'votes_count': rating_data.get('votes', 0)
-                        }
-                    )
-                    
-                    if created:
-                        stats['ratings_created'] += 1
-                    else:
-                        stats['ratings_updated'] += 1
+                    ratings_to_save['imdb'] = kp_ratings['imdb']
                         
         except Exception as e:
             logger.error(f"Ошибка обновленя рейтингов Кинопоиска для {film.title}: {str(e)}")
         
+        if ratings_to_save:
+            existing_sources = set(film.ratings.values_list('source', flat=True))
+            for source_key in ratings_to_save:
+                source = RATING_SOURCE_MAPPING[source_key]
+                if source in existing_sources:
+                    stats['ratings_updated'] += 1
+                else:
+                    stats['ratings_created'] += 1
+                stats['sources'].append(source)
+            
+            save_ratings_bulk({film: ratings_to_save})
+        
         composite_rating = RatingCalculator.calculate_composite_rating(film)
         if composite_rating:
             film.composite_rating = composite_rating
@@ -181,7 +147,7 @@ def fetch_film_data(self, tmdb_id: int, update_existing: bool = False) -> dict:
                 'film_title': film.title
             }
     
-        tmdb_service = TMDBService()
+        tmdb_service = shared_client(TMDBService)
         
         movie_data = tmdb_service.get_movie_details(
             tmdb_id,
@@ -193,8 +159,7 @@ def fetch_film_data(self, tmdb_id: int, update_existing: bool = False) -> dict:
             logger.error(f"Из TMDB ID не получено данных {tmdb_id}")
             return {'status': 'error', 'message': 'Нет данных из TMDB'}
         
-        release_date = movie_data.get('release_date', '')
-        year = int(release_date[:4]) if release_date and len(release_date) >= 4 else None
+        year = parse_release_year(movie_data.get('release_date'))
         
         with transaction.atomic():
             film, created = Film.objects.update_or_create(
@@ -213,50 +178,9 @@ def fetch_film_data(self, tmdb_id: int, update_existing: bool = False) -> dict:
             
             crew = credits.get('crew', [])
             directors = [person for person in crew if person.get('job') == 'Director']
-            
-            for director_data in directors:
-                person_id = director_data.get('id')
-                if person_id:
-                    person, _ = Person.objects.get_or_create(
-                        tmdb_id=person_id,
-                        defaults={
-                            'name': director_data.get('name', ''),
-                            'original_name': director_data.get('original_name', ''),
-                            'profession': Person.ProfessionChoices.DIRECTOR
-                        }
-                    )
-                    
-                    from .models import FilmPersonRole
-                    FilmPersonRole.objects.get_or_create(
-                        film=film,
-                        person=person,
-                        role=FilmPersonRole.RoleChoices.DIRECTOR
-                    )
-            
             cast = credits.get('cast', [])[:10]  
             
-            for i, actor_data in enumerate(cast):
-                person_id = actor_data.get('id')
-                if person_id:
-                    person, _ = Person.objects.get_or_create(
-                        tmdb_id=person_id,
-                        defaults={
-                            'name': actor_data.get('name', ''),
-                            'original_name': actor_data.get('original_name', ''),
-                            'profession': Person.ProfessionChoices.ACTOR
-                        }
-                    )
-                    
-                    from .models import FilmPersonRole
-                    FilmPersonRole.objects.get_or_create(
-                        film=film,
-                        person=person,
-                        role=FilmPersonRole.RoleChoices.ACTOR,
-                        defaults={
-                            'character_name': actor_data.get('character', ''),
-                            'order': actor_data.get('order', i)
-                        }
-                    )
+            upsert_persons_bulk([(film, credits)], max_cast=10)
         
         update_film_ratings.delay(film.id)
         
@@ -295,10 +219,15 @@ def update_person_data(self, person_id: int) -> dict:
     
     logger.info(f"Начало обновления данных для: {person.name} (ID: {person_id})")
     
-    tmdb_service = TMDBService()
+    tmdb_service = shared_client(TMDBService)
     
     try:
-        person_data = tmdb_service.get_person_details(person.tmdb_id, language='ru-RU')
+        person_data = tmdb_service.get_person_details(
+            person.tmdb_id,
+            append_to_response='movie_credits',
+            language='ru-RU',
+            use_cache=False
+        )
         
         if not person_data:
             return {'status': 'error', 'message': 'Нет данных с TMDB'}
@@ -330,7 +259,7 @@ def update_person_data(self, person_id: int) -> dict:
         else:
             logger.info(f"Для {person.name} нет обновлений")
         
-        movie_credits = tmdb_service.get_person_movie_credits(person.tmdb_id, language='ru-RU')
+        movie_credits = person_data.get('movie_credits', {})
         
         # Будущая логика обновления фильмографии
         
@@ -533,14 +462,15 @@ def cleanup_old_tasks(days_old: int = 30) -> dict:
 def check_api_status() -> dict:
     """
     Задача для проверки статуса внешних API.
+    Запросы выполняются в обход кэша, чтобы проверялась реальная доступность API.
     """
     from .services import TMDBService, OMDbService, KinopoiskService
     
     api_status = {}
     
     try:
-        tmdb_service = TMDBService()
-        tmdb_response = tmdb_service.search_movies("test", page=1)
+        tmdb_service = shared_client(TMDBService)
+        tmdb_response = tmdb_service.get("search/movie", params={"query": "test", "page": 1}, use_cache=False)
         api_status['tmdb'] = {
             'status': 'ok' if 'results' in tmdb_response else 'error',
             'message': 'TMDB API is working' if 'results' in tmdb_response else 'TMDB API error'
@@ -552,8 +482,8 @@ def check_api_status() -> dict:
         }
     
     try:
-        omdb_service = OMDbService()
-        omdb_response = omdb_service.search_movies("test", page=1)
+        omdb_service = shared_client(OMDbService)
+        omdb_response = omdb_service.get("/", params={"s": "test", "page": 1}, use_cache=False)
         api_status['omdb'] = {
             'status': 'ok' if 'Search' in omdb_response else 'error',
             'message': 'OMDb API is working' if 'Search' in omdb_response else 'OMDb API error'
@@ -565,8 +495,8 @@ def check_api_status() -> dict:
         }
     
     try:
-        kinopoisk_service = KinopoiskService()
-        kinopoisk_response = kinopoisk_service.search_movies("test", page=1)
+        kinopoisk_service = shared_client(KinopoiskService)
+        kinopoisk_response = kinopoisk_service.get("films", params={"keyword": "test", "page": 1}, use_cache=False)
         api_status['kinopoisk'] = {
             'status': 'ok' if 'items' in kinopoisk_response else 'error',
             'message': 'Kinopoisk API is working' if 'items' in kinopoisk_response else 'Kinopoisk API error'
@@ -650,9 +580,9 @@ def search_trending_films(limit: int = 20) -> dict:
     try:
         from .services import TMDBService
         
-        tmdb_service = TMDBService()
+        tmdb_service = shared_client(TMDBService)
         
-        trending_data = tmdb_service.get("trending/movie/week", params={"language": "ru-RU"})
+        trending_data = tmdb_service.get("trending/movie/week", params={"language": "ru-RU"}, use_cache=False)
         
         if not trending_data or 'results' not in trending_data:
             return {'status': 'error', 'message': 'Нет данных'}
@@ -1,4 +1,5 @@
 import logging
+import re
 from django.shortcuts import render, redirect
 from django.contrib import messages
 
@@ -7,6 +8,8 @@ from .services.person_service import PersonService
 
 logger = logging.getLogger(__name__)
 
+IMDB_ID_RE = re.compile(r'tt\d+')
+
 
 def home(request):
     """Главная страница с кнопками поиска."""
@@ -45,8 +48,11 @@ def film_search(request):
 def film_detail(request, kinopoisk_id):
     """Страница фильма со всеми рейтингами."""
     try:
+        # IMDb ID из ссылки поиска — только подсказка для параллельного запроса к OMDb,
+        # поэтому значения не в формате IMDb отбрасываются
+        imdb_id = request.GET.get('imdb', '')
         service = MovieService()
-        film_data = service.get_movie_data(kinopoisk_id)
+        film_data = service.get_movie_data(kinopoisk_id, imdb_id=imdb_id if IMDB_ID_RE.fullmatch(imdb_id) else None)
         
         if not film_data:
             messages.error(request, 'Фильм не найден')
@@ -96,9 +102,7 @@ def film_detail(request, kinopoisk_id):
 
 def force_refresh(request, kinopoisk_id):
     """Принудительное обновление данных фильма."""
-    from django.core.cache import cache
-    cache.delete(f'movie_full_data_{kinopoisk_id}')
-    cache.delete(f'kp_search_*')  
+    MovieService().invalidate_movie_data(kinopoisk_id)
     
     messages.success(request, 'Данные фильма будут обновлены при следующем просмотре')
     return redirect('film_detail', kinopoisk_id=kinopoisk_id)